@@ -1,12 +1,27 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
-import netCDF4 as nc4
+from functools import partial
+from thermo import add_thermo
+from nc_lazy import LazyDataset
+from clim_stat import stream_stat
+from eddy_flux import pair_names, flux_terms, flux_label, flux_levels
+from vert_int import vert_mean, col_transport
+from fig_batch import render_all
+from clim_cache import DiskCache, cache_key
+from clim_multi import build_clim
 
 
 # Setup parameters and constants
 make_clim = True # Climatology
 make_tran = False # Transport
+# (velocity, tracer) pairs for the transport plots, e.g. ('v','q'),
+# ('v','u') or ('w','theta'); see flux_info in eddy_flux.py
+tran_pairs = [('v','t'),('v','q'),('v','u')]
+make_batch = False # Render all months/levels to files (headless)
+batch_path = './atmo_figs/'
+use_cache = True # Reuse theta/thetae and statistics of previous runs
+cache_path = './atmo_cache/'
 l_e = 2.5E+6 # latent heat vaporization
 rcp = 0.285 # R/Cp
 cp  = 1004. # J/kg/K
@@ -16,6 +31,9 @@ map_type = 'nomap'
 #map_type = 'basemap'
 #map_type = 'cartopy'
 
+if make_batch is True:
+    plt.switch_backend('Agg') # no windows: figures are rendered to files
+
 
 if map_type == 'basemap':
     from mpl_toolkits.basemap import Basemap
@@ -39,49 +57,94 @@ if map_type == 'cartopy':
         return ax
 
 
-# Compute annual and zonal means, and deviations
-def comp_stat(var):
-    var_am = np.mean(var,axis=0)
-    var_zm = np.mean(var,axis=3)
-    var_pp = var - var_am[None,:,:,:]  # prime 
-    var_ss = var - var_zm[:,:,:,None]  # star
-    return var_am, var_zm, var_pp, var_ss
-
-
-# Open atmospheric data
+# Open atmospheric data (lazily: slabs are read only when indexed).
+# For a multi-year climatology list more files (in time order) in
+# atmo_list: the statistics are then built over all of them, in
+# parallel, while maps are taken from the first file.
 data_path = './atmo_ocean_data/'
-atmo_file = nc4.Dataset(data_path+'uvwtqgph_2000_01_07.nc','r')
+atmo_list = [data_path+'uvwtqgph_2000_01_07.nc']
+#atmo_list = sorted(glob.glob(data_path+'uvwtqgph_*.nc')) # needs `import glob`
+atmo_file = LazyDataset(atmo_list[0])
 # time/lev/lat/lon
-ua   = atmo_file.variables['u'][:]
-va   = atmo_file.variables['v'][:]
-wa   = atmo_file.variables['w'][:]
-ta   = atmo_file.variables['t'][:]
-qq   = atmo_file.variables['q'][:]
-zz   = atmo_file.variables['z'][:]
-tim  = atmo_file.variables['time'][:]
-lev  = atmo_file.variables['levelist'][:]
-lat  = atmo_file.variables['latitude'][:]
-lon  = atmo_file.variables['longitude'][:]
-atmo_file.close()
-
-theta  = np.zeros((len(tim),len(lev),len(lat),len(lon)),dtype='f') 
-thetae = np.zeros((len(tim),len(lev),len(lat),len(lon)),dtype='f') 
-
-# Compute potential and equivalent potential temperatures
-for itim in range(len(tim)):
-    for jlat in range(len(lat)):
-        for klon in range(len(lon)):
-            theta[itim,:,jlat,klon]  = ta[itim,:,jlat,klon]*((1000./lev)**rcp)
-            thetae[itim,:,jlat,klon] = theta[itim,:,jlat,klon]*\
-                                       np.exp((qq[itim,:,jlat,klon]*l_e)/\
-                                               (ta[itim,:,jlat,klon]*cp))
-
-# TODO add other vars
-ta_am, ta_zm, ta_pp, ta_ss = comp_stat(ta)
-va_am, va_zm, va_pp, va_ss = comp_stat(va)
-theta_am, theta_zm, theta_pp, theta_ss = comp_stat(theta)
-thetae_am, thetae_zm, thetae_pp, thetae_ss = comp_stat(thetae)
-ta_va_am, ta_va_zm, ta_va_pp, ta_va_ss = comp_stat(ta*va)
+ua   = atmo_file['u']
+va   = atmo_file['v']
+wa   = atmo_file['w']
+ta   = atmo_file['t']
+qq   = atmo_file['q']
+zz   = atmo_file['z']
+tim  = atmo_file.coord('time')
+lev  = atmo_file.coord('levelist')
+lat  = atmo_file.coord('latitude')
+lon  = atmo_file.coord('longitude')
+
+# Fields for the statistics and eddy covariances: t, v, q (for
+# theta/thetae) and the file fields of the pairs, nothing else is read
+names = ['t','v','theta','thetae']
+pairs = []
+if make_tran is True:
+    pairs = tran_pairs
+    names = names + [name for name in pair_names(pairs) if name not in names]
+fields = {'u':ua,'v':va,'w':wa,'t':ta,'q':qq,'z':zz}
+sources = {name:fields[name] for name in ['t','v','q']+pair_names(pairs)
+           if name in fields}
+
+# Compute potential and equivalent potential temperatures (per chunk)
+add_theta = partial(add_thermo,lev=lev,rcp=rcp,l_e=l_e,cp=cp)
+
+# Look for the results of a previous run with the same file(s) and
+# parameters (cached arrays are memory mapped, not loaded)
+cache = DiskCache(cache_path)
+cache_id = cache_key(atmo_list,rcp=rcp,l_e=l_e,cp=cp,names=names,pairs=pairs)
+cached = None
+if use_cache is True:
+    cached = cache.get(cache_id)
+
+if cached is None and len(atmo_list) > 1:
+
+    # Multi-year climatology: one worker per file, partial sums merged
+    # (zonal means are then monthly climatologies)
+    stats = build_clim(atmo_list,{name:name for name in sources},pairs,
+                       derive=add_theta,names=names).result()
+    theta = None; thetae = None
+    if use_cache is True:
+        cache.put(cache_id,{'stats':stats})
+
+elif cached is None:
+
+    theta = None; thetae = None
+    if use_cache is True:
+        writer = cache.writer(cache_id)
+        theta  = writer.array('theta',ta.shape)
+        thetae = writer.array('thetae',ta.shape)
+
+    # Add theta/thetae to each chunk, and store them in the cache
+    def add_theta_store(chunk,t0):
+        add_theta(chunk,t0)
+        if theta is not None:
+            theta[t0:t0+len(chunk['t'])] = chunk['theta']
+            thetae[t0:t0+len(chunk['t'])] = chunk['thetae']
+
+    # Compute annual and zonal means, and eddy covariances, in one
+    # pass over the data (no full-size prime/star anomalies are stored)
+    stats = stream_stat(sources,pairs,derive=add_theta_store,names=names)
+    stats = stats.result()
+
+    if use_cache is True:
+        theta.flush(); thetae.flush()
+        writer.save({'stats':stats})
+        writer.commit()
+        cached = cache.get(cache_id)
+        theta, thetae = cached['theta'], cached['thetae']
+
+else:
+    stats = cached['stats']
+    theta, thetae = cached.get('theta'), cached.get('thetae')
+
+flux = flux_terms(stats,pairs)
+ta_am, ta_zm = stats['am']['t'], stats['zm']['t']
+va_am, va_zm = stats['am']['v'], stats['zm']['v']
+theta_am, theta_zm = stats['am']['theta'], stats['zm']['theta']
+thetae_am, thetae_zm = stats['am']['thetae'], stats['zm']['thetae']
 
 
 if make_clim is True: 
@@ -198,63 +261,118 @@ if make_clim is True:
 
 if make_tran is True: 
 
-   # Fig 13.5 PO92
-   var_am = ta_am; var_pp = ta_pp; var_ss = ta_ss; var_name = 'Sensible heat'; var_uni = 'K m/s' 
-
-   plt.figure() 
-   clevs = np.linspace(-10,10,11) 
-   plt.contour(lat,lev,np.mean(np.mean(va_pp*var_pp,axis=0),axis=2),levels=clevs,colors='k')
-   plt.contourf(lat,lev,np.mean(np.mean(va_pp*var_pp,axis=0),axis=2),levels=clevs,cmap='bwr')
-   plt.xlim([-80,80])
-   plt.ylim([1000,150])
-   plt.colorbar(orientation='horizontal')
-   plt.xlabel('Latitude (deg)')
-   plt.ylabel('Pressure (mb)')
-   plt.title(var_name+' -- transient eddies ('+var_uni+')') 
-
-   plt.figure() 
-   clevs = np.linspace(-5,5,11)
-   plt.contour(lat,lev,np.mean(np.mean(va_ss,axis=0)*np.mean(var_ss,axis=0),axis=2),levels=clevs,colors='k')
-   plt.contourf(lat,lev,np.mean(np.mean(va_ss,axis=0)*np.mean(var_ss,axis=0),axis=2),levels=clevs,cmap='bwr')  
-   plt.xlim([-80,80])
-   plt.ylim([1000,150])
-   plt.colorbar(orientation='horizontal')
-   plt.xlabel('Latitude (deg)')
-   plt.ylabel('Pressure (mb)')
-   plt.title(var_name+' -- stationary eddies ('+var_uni+')') 
-
-   plt.figure() 
-   clevs = np.linspace(-500,500,11)
-   plt.contour(lat,lev,np.mean(va_am,axis=2)*np.mean(var_am,axis=2),levels=clevs,colors='k')
-   plt.contourf(lat,lev,np.mean(va_am,axis=2)*np.mean(var_am,axis=2),levels=clevs,cmap='bwr')  
-   plt.xlim([-80,80])
-   plt.ylim([1000,150])
-   plt.colorbar(orientation='horizontal')
-   plt.xlabel('Latitude (deg)')
-   plt.ylabel('Pressure (mb)')
-   plt.title(var_name+' -- mean circulation ('+var_uni+')') 
-
-   # Annual mean time series (TODO add weighting)
-   levt = lev[12:23] # 200-1000 hPa
-   ts_tran = np.mean(np.mean(np.mean(va_pp*var_pp,axis=0),axis=2)[12:23,:],axis=0)
-   ts_stat = np.mean(np.mean(np.mean(va_ss,axis=0)*np.mean(var_ss,axis=0),axis=2)[12:23,:],axis=0)
-   ts_mean = np.mean(np.mean(va_am,axis=2)[12:23,:]*np.mean(var_am,axis=2)[12:23,:],axis=0)
-
-   plt.figure()
-   plt.plot(lat,ts_tran*10,'k-',label='10x trans')
-   plt.plot(lat,ts_stat*10,'k--',label='10x stat')
-   plt.plot(lat,ts_mean,'k:',label='mean')
-   plt.xlim([-60,60])  
-   plt.ylim([-40,40])  
-   plt.axhline(0,color='grey')
-   plt.xlabel('Latitude (deg)')
-   plt.ylabel('Northward flux ('+var_uni+')')
-   plt.legend()
+   # Fig 13.5 PO92, for each flux
+   for var_pair in tran_pairs:
+
+      var_name, var_uni = flux_label(var_pair)
+      var_tran = flux[var_pair]['tran'] # transient eddies
+      var_stat = flux[var_pair]['stat'] # stationary eddies
+      var_mean = flux[var_pair]['mean'] # mean circulation
+
+      plt.figure() 
+      clevs = flux_levels(var_pair,'tran',var_tran)
+      plt.contour(lat,lev,var_tran,levels=clevs,colors='k')
+      plt.contourf(lat,lev,var_tran,levels=clevs,cmap='bwr')
+      plt.xlim([-80,80])
+      plt.ylim([1000,150])
+      plt.colorbar(orientation='horizontal')
+      plt.xlabel('Latitude (deg)')
+      plt.ylabel('Pressure (mb)')
+      plt.title(var_name+' -- transient eddies ('+var_uni+')') 
+
+      plt.figure() 
+      clevs = flux_levels(var_pair,'stat',var_stat)
+      plt.contour(lat,lev,var_stat,levels=clevs,colors='k')
+      plt.contourf(lat,lev,var_stat,levels=clevs,cmap='bwr')  
+      plt.xlim([-80,80])
+      plt.ylim([1000,150])
+      plt.colorbar(orientation='horizontal')
+      plt.xlabel('Latitude (deg)')
+      plt.ylabel('Pressure (mb)')
+      plt.title(var_name+' -- stationary eddies ('+var_uni+')') 
+
+      plt.figure() 
+      clevs = flux_levels(var_pair,'mean',var_mean)
+      plt.contour(lat,lev,var_mean,levels=clevs,colors='k')
+      plt.contourf(lat,lev,var_mean,levels=clevs,cmap='bwr')  
+      plt.xlim([-80,80])
+      plt.ylim([1000,150])
+      plt.colorbar(orientation='horizontal')
+      plt.xlabel('Latitude (deg)')
+      plt.ylabel('Pressure (mb)')
+      plt.title(var_name+' -- mean circulation ('+var_uni+')') 
+
+      # Annual mean time series (mass weighted, 200-1000 hPa)
+      ts_tran = vert_mean(var_tran,lev,axis=0,bounds=(200,1000))
+      ts_stat = vert_mean(var_stat,lev,axis=0,bounds=(200,1000))
+      ts_mean = vert_mean(var_mean,lev,axis=0,bounds=(200,1000))
+
+      plt.figure()
+      plt.plot(lat,ts_tran*10,'k-',label='10x trans')
+      plt.plot(lat,ts_stat*10,'k--',label='10x stat')
+      plt.plot(lat,ts_mean,'k:',label='mean')
+      plt.xlim([-60,60])  
+      if var_pair == ('v','t'):
+         plt.ylim([-40,40])  
+      plt.axhline(0,color='grey')
+      plt.xlabel('Latitude (deg)')
+      plt.ylabel('Northward flux ('+var_uni+')')
+      plt.legend()
+
+   # Column integrated energy transports (cp*vT, L*vq, vz), with all
+   # pairs and terms integrated at once
+   en_fac = {'t':cp, 'q':l_e, 'z':1.}
+   en_pairs = [pp for pp in tran_pairs if pp[0] == 'v' and pp[1] in en_fac]
+   if len(en_pairs) > 0:
+      en_flux = np.array([[flux[pp][term] for term in ['tran','stat','mean']]
+                          for pp in en_pairs])
+      en_fac = np.array([en_fac[pp[1]] for pp in en_pairs])[:,None,None]
+      en_tran = col_transport(en_flux,lev,lat,en_fac)/1E+15 # PW
+
+      plt.figure()
+      for ipair, var_pair in enumerate(en_pairs):
+         plt.plot(lat,np.sum(en_tran[ipair],axis=0),label=flux_label(var_pair)[0])
+      plt.plot(lat,np.sum(en_tran,axis=(0,1)),'k-',label='total')
+      plt.xlim([-90,90])
+      plt.axhline(0,color='grey')
+      plt.xlabel('Latitude (deg)')
+      plt.ylabel('Northward transport (PW)')
+      plt.legend()
+
    plt.show()
 
+
+if make_batch is True:
+
+    # One spec per figure: zonal mean temperatures for each month, and
+    # temperature and omega maps for each month and level. Maps only
+    # hold a reference to their slab, which is read by the worker.
+    specs = []
+    for imon in range(len(tim)):
+        specs.append({'fname':'temp_zm_m%02i' % (imon+1),
+                      'x':lat, 'y':lev, 'z':theta_zm[imon],
+                      'levels':np.linspace(250,450,11), 'colorbar':'vertical',
+                      'contour':ta_zm[imon], 'clevels':np.linspace(200,300,11),
+                      'yscale':'log', 'ylim':[1000,100],
+                      'xlabel':'Latitude (deg)', 'ylabel':'Pressure (mb)',
+                      'title':'Temperature month= %i' % (imon+1)})
+        for jlev in range(len(lev)):
+            specs.append({'fname':'temp_m%02i_%04imb' % (imon+1,lev[jlev]),
+                          'x':lon, 'y':lat,
+                          'z':{'path':atmo_file.path,'var':'t','index':(imon,jlev)},
+                          'levels':220+np.arange(11)*10, 'cmap':'bwr',
+                          'extend':'both', 'colorbar':'horizontal',
+                          'title':'Temperature month= %i @ %i mb' % (imon+1,lev[jlev])})
+            specs.append({'fname':'omega_m%02i_%04imb' % (imon+1,lev[jlev]),
+                          'x':lon, 'y':lat,
+                          'z':{'path':atmo_file.path,'var':'w','index':(imon,jlev)},
+                          'levels':np.linspace(-0.2,0.2,11), 'cmap':'bwr',
+                          'extend':'both', 'colorbar':'horizontal',
+                          'title':'Pressure tendency month= %i @ %i mb' % (imon+1,lev[jlev])})
+    render_all(specs,batch_path)
+
 plt.show()
 
 
-# Note: for computing vertical integrals, you can use 
-# https://numpy.org/doc/stable/reference/generated/numpy.trapz.html#
-# but be careful -- dx is not constant!
+# Note: for computing vertical integrals, see vert_int.py (levels
+# are not equally spaced, so the weights dp/g differ by level)
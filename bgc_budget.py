@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Global carbon budget from the EGG4 CO2 fluxes (kg CO2 m-2 s-1).
+
+Each flux is integrated over the true areas of the grid cells
+(wgt_mean.cell_areas, cached per grid) and over the seconds of each
+month, then summed by calendar year and converted to PgC/yr. All
+components and months are integrated by one contraction, and all
+years by one matrix product. Fluxes are positive upward (into the
+atmosphere), so the sum of the land (NEE), ocean and anthropogenic
+fluxes is the implied atmospheric growth, to be compared with the
+growth of the CO2 global mean (the residual).
+"""
+
+import numpy as np
+from wgt_mean import cell_areas
+
+
+c_co2 = 12.011/44.009 # kg C per kg CO2
+pgc_ppm = 2.124 # PgC per ppm of atmospheric CO2
+
+# Budget components (EGG4 names)
+budget_names = {'land':'fco2nee', 'ocean':'co2of', 'anthro':'co2apf'}
+
+
+def month_seconds(yyyy0,ntim):
+    """ Length (s) of the `ntim` months starting in January yyyy0 """
+    months = np.datetime64('%04i-01' % yyyy0,'M')+np.arange(ntim+1)
+    days = np.diff(months.astype('datetime64[D]')).astype('f8')
+    return days*86400.
+
+
+def month_totals(fields,lat,lon):
+    """ (ncomp,time) area integrals (kg/s) of a list of (time,lat,lon)
+    fluxes (kg m-2 s-1), in one contraction """
+    flux = np.stack([np.asarray(ff) for ff in fields])
+    return np.einsum('ctyx,yx->ct',flux,cell_areas(lat,lon),dtype='f8')
+
+
+def carbon_budget(totals,yyyy0,co2_gm=None):
+    """ Yearly budget (PgC/yr) from a dict of monthly area integrals
+    (kg CO2/s, see month_totals) with keys 'land', 'ocean', 'anthro',
+    and optionally the monthly global mean CO2 (ppm) for the observed
+    growth and the residual. Partial years are integrated over their
+    months only ('nmon'). """
+    names = list(budget_names)
+    tot = np.stack([np.asarray(totals[kk],dtype='f8') for kk in names])
+    ntim = tot.shape[1]
+    year = yyyy0+np.arange(ntim)//12
+    years = np.unique(year)
+    # (year,time) matrix of month lengths: all years in one product
+    secs = (year[None,:] == years[:,None])*month_seconds(yyyy0,ntim)[None,:]
+    pgc = tot @ secs.T * c_co2*1E-12
+    budget = {'year':years,'nmon':np.sum(year[None,:] == years[:,None],axis=1)}
+    budget.update(zip(names,pgc))
+    budget['total'] = np.sum(pgc,axis=0)
+    if co2_gm is not None:
+        co2_am = np.array([np.mean(co2_gm[year == yy]) for yy in years])
+        budget['growth'] = np.gradient(co2_am)*pgc_ppm if len(years) > 1 \
+                           else np.full(1,np.nan)
+        budget['residual'] = budget['growth']-budget['total']
+    return budget
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Monthly climatologies, anomalies and running annual means of
+(time,...) monthly fields (e.g. the EGG4 tcco2, tcch4 and fluxes).
+
+The full years of a record are viewed, without copy, as
+(years,12,...), so that each statistic is a single reduction over
+the years axis. A partial trailing year (ntim not a multiple of 12)
+is added to the months it covers, which are then averaged over one
+more year than the others.
+
+For records too large for memory, stream_means reads one or several
+files a block of months at a time, and accumulates the time means,
+the monthly climatologies and the zonal and global means of each
+step, so that only one block is in memory at once.
+"""
+
+import numpy as np
+from nc_lazy import LazyDataset
+from thermo import read_chunk
+from clim_stat import zonal_mean
+from wgt_mean import wgt_mean
+
+
+def cycle_view(var,ncycle=12):
+    """ (years,ncycle,...) view of the full years of `var` (time,...),
+    and the (ntail,...) partial trailing year """
+    var = np.asarray(var)
+    nyear = var.shape[0]//ncycle
+    full = var[:nyear*ncycle].reshape((nyear,ncycle)+var.shape[1:])
+    return full, var[nyear*ncycle:]
+
+
+def monthly_clim(var,ncycle=12):
+    """ (ncycle,...) mean of each calendar month """
+    full, tail = cycle_view(var,ncycle)
+    ssum = np.sum(full,axis=0,dtype='f8')
+    nval = np.full(ncycle,full.shape[0],dtype='f8')
+    ssum[:len(tail)] += tail
+    nval[:len(tail)] += 1
+    nval = nval.reshape((ncycle,)+(1,)*(ssum.ndim-1))
+    with np.errstate(invalid='ignore',divide='ignore'):
+        return (ssum/nval).astype('f')
+
+
+def anomalies(var,clim=None,ncycle=12):
+    """ Deseasonalized `var`: departures from the monthly climatology
+    (computed if not given), same shape as `var` """
+    if clim is None:
+        clim = monthly_clim(var,ncycle)
+    full, tail = cycle_view(var,ncycle)
+    anom = np.empty(np.shape(var),dtype='f')
+    nfull = full.shape[0]*ncycle
+    anom[:nfull].reshape(full.shape)[:] = full - clim[None]
+    anom[nfull:] = tail - clim[:len(tail)]
+    return anom
+
+
+def running_annual(var,ncycle=12):
+    """ Running mean over `ncycle` months (time-ncycle+1,...), the
+    value at index i being the mean of months i to i+ncycle-1 """
+    csum = np.cumsum(np.asarray(var),axis=0,dtype='f8')
+    csum = np.concatenate([np.zeros((1,)+csum.shape[1:]),csum])
+    return ((csum[ncycle:]-csum[:-ncycle])/ncycle).astype('f')
+
+
+def cycle_stats(fields,ncycle=12,anom=None,ann=None):
+    """ {name: {'clim','anom','ann'}} for a dict of (time,...) fields,
+    with 'anom' and 'ann' only for the names in `anom` and `ann`
+    (default: all the fields) """
+    stats = {}
+    for name, var in fields.items():
+        clim = monthly_clim(var,ncycle)
+        stats[name] = {'clim':clim}
+        if anom is None or name in anom:
+            stats[name]['anom'] = anomalies(var,clim,ncycle)
+        if ann is None or name in ann:
+            stats[name]['ann'] = running_annual(var,ncycle)
+    return stats
+
+
+def stream_means(paths,names,nchunk=12,ncycle=12,areas=None):
+    """ Statistics of the fields `names` of the files `paths` (in time
+    order, the first one starting in January), read `nchunk` months at
+    a time: {name: {'tm' time mean (lat,lon), 'clim' (ncycle,lat,lon),
+    'zm' zonal means (time,lat), 'gm' cos-lat global means (time,)}},
+    plus the 'lat' and 'lon' coordinates. With `areas`, a function of
+    (lat,lon) giving the cell areas, also 'tot', the area integrals
+    (time,). """
+    acc = {name:{'tsum':0.,'csum':0.,'zm':[],'gm':[],'tot':[]} for name in names}
+    ccnt = np.zeros(ncycle)
+    t0 = 0
+    for path in paths:
+        ds = LazyDataset(path,maxbytes=0) # each block read once
+        lat, lon = ds.coord('lat'), ds.coord('lon')
+        lat_wgt = np.cos(lat*np.pi/180.)
+        area = None if areas is None else areas(lat,lon)
+        ntim = ds[names[0]].shape[0]
+        for t1 in range(0,ntim,nchunk):
+            t2 = min(t1+nchunk,ntim)
+            slots = (t0+np.arange(t1,t2)) % ncycle
+            for name in names:
+                chunk = read_chunk(ds[name],t1,t2)
+                aa = acc[name]
+                aa['tsum'] = aa['tsum'] + np.sum(chunk,axis=0,dtype='f8')
+                if np.ndim(aa['csum']) == 0:
+                    aa['csum'] = np.zeros((ncycle,)+chunk.shape[1:])
+                for it, slot in enumerate(slots):
+                    aa['csum'][slot] += chunk[it]
+                zm = zonal_mean(chunk)
+                aa['zm'].append(zm.astype('f'))
+                aa['gm'].append(wgt_mean(zm,lat_wgt,axis=-1))
+                if area is not None:
+                    aa['tot'].append(np.einsum('tyx,yx->t',chunk,area,dtype='f8'))
+            np.add.at(ccnt,slots,1)
+        t0 += ntim
+        ds.clear()
+    res = {'lat':lat,'lon':lon}
+    with np.errstate(invalid='ignore',divide='ignore'):
+        for name, aa in acc.items():
+            res[name] = {'tm':(aa['tsum']/t0).astype('f'),
+                         'clim':(aa['csum']/ccnt[:,None,None]).astype('f'),
+                         'zm':np.concatenate(aa['zm']),
+                         'gm':np.concatenate(aa['gm'])}
+            if areas is not None:
+                res[name]['tot'] = np.concatenate(aa['tot'])
+    return res
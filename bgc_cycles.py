@@ -2,6 +2,11 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import netCDF4 as nc4
+from bgc_clim import cycle_stats, running_annual, stream_means
+from bgc_trend import trend_fit, growth_rate
+from bgc_budget import budget_names, month_totals, carbon_budget
+from wgt_mean import cell_areas
+from fig_batch import render_all
 
 # Select the background map library
 #map_type = 'nomap'
@@ -9,6 +14,11 @@ import netCDF4 as nc4
 map_type = 'cartopy'
 
 path_data = './tmp_bgc/' 
+make_batch = False # Render all maps and series to files (headless)
+batch_path = './bgc_figs/'
+
+if make_batch is True:
+    plt.switch_backend('Agg') # no windows: figures are rendered to files
 
 if map_type == 'basemap':
 
@@ -33,21 +43,55 @@ if map_type == 'cartopy':
         return ax
 
 
-# Open file with all variables
+# Open file(s) with all variables
 yyyy0 = 2004; yyyy1 = 2013
 units = {'tcco2':'ppm','tcch4':'ppb','flux':'kg m-2 s-1'}
-ncf = nc4.Dataset(path_data+f'ghg_EGG4_{yyyy0}-{yyyy1}.nc','r')
-lat = ncf.variables['lat'][:]
-lon = ncf.variables['lon'][:]
-tcco2 = ncf.variables['tcco2'][:]
-tcch4 = ncf.variables['tcch4'][:]
-fco2nee = ncf.variables['fco2nee'][:]
-fco2oce = ncf.variables['co2of'][:]
-fco2ant = ncf.variables['co2apf'][:]
-ncf.close()
-
-# Get the number of months in the file
-ntim = tcco2.shape[0]
+bgc_files = [path_data+f'ghg_EGG4_{yyyy0}-{yyyy1}.nc'] # in time order
+bgc_names = ['tcco2','tcch4','fco2nee','co2of','co2apf']
+use_stream = False # read a block of months at a time (bounded memory,
+                   # e.g. for the full record until 2020), means only
+
+if use_stream is True:
+    # Time, monthly, zonal and global means, accumulated block by block
+    bgc = stream_means(bgc_files,bgc_names,nchunk=12,areas=cell_areas)
+    lat, lon = bgc['lat'], bgc['lon']
+    bgc_tm = {name:bgc[name]['tm'] for name in bgc_names}
+    bgc_clim = {name:bgc[name]['clim'] for name in bgc_names}
+    bgc_gm = {name:bgc[name]['gm'] for name in bgc_names}
+    # Monthly area integrals of the fluxes (kg/s)
+    bgc_tot = {name:bgc[name]['tot'] for name in budget_names.values()}
+
+else:
+    ncf = nc4.Dataset(bgc_files[0],'r')
+    lat = ncf.variables['lat'][:]
+    lon = ncf.variables['lon'][:]
+    tcco2 = ncf.variables['tcco2'][:]
+    tcch4 = ncf.variables['tcch4'][:]
+    fco2nee = ncf.variables['fco2nee'][:]
+    fco2oce = ncf.variables['co2of'][:]
+    fco2ant = ncf.variables['co2apf'][:]
+    ncf.close()
+    bgc_fields = {'tcco2':tcco2,'tcch4':tcch4,'fco2nee':fco2nee,
+                  'co2of':fco2oce,'co2apf':fco2ant}
+
+    # Monthly climatologies of all the variables, and anomalies
+    # (deseasonalized) of CO2 and CH4 for the trends (a partial last
+    # year is allowed)
+    bgc_stats = cycle_stats(bgc_fields,anom=['tcco2','tcch4'],ann=[])
+    bgc_tm = {name:np.mean(var,axis=0) for name, var in bgc_fields.items()}
+    bgc_clim = {name:bgc_stats[name]['clim'] for name in bgc_names}
+
+    # Compute zonal and global means, area-weighting is required
+    lat_wgt = np.cos(lat*np.pi/180.)
+    bgc_gm = {name:np.average(np.mean(var,axis=2),weights=lat_wgt,axis=1)
+              for name, var in bgc_fields.items()}
+    # Monthly area integrals of the fluxes (kg/s), true cell areas
+    bgc_tot = dict(zip(budget_names.values(),
+                       month_totals([bgc_fields[name] for name in budget_names.values()],
+                                    lat,lon)))
+
+# Get the number of months in the file(s)
+ntim = len(bgc_gm['tcco2'])
 
 
 plt.figure(figsize=(6,4))
@@ -63,14 +107,14 @@ if map_type == 'basemap':
 
 if map_type == 'cartopy': # use transform keyword
     map_setup() 
-    plt.contourf(lon,lat,np.mean(tcco2,axis=0),levels=clevs_co2,
+    plt.contourf(lon,lat,bgc_tm['tcco2'],levels=clevs_co2,
                  extend='both',transform=ccrs.PlateCarree(),cmap='PRGn_r')
     clb = plt.colorbar()
     clb.set_label(units['tcco2'])
 
 
 if map_type in ['nomap','basemap']: # no transform
-    plt.contourf(lon,lat,np.mean(tcco2,axis=0))
+    plt.contourf(lon,lat,bgc_tm['tcco2'])
 
 plt.figure(figsize=(6,4))
 
@@ -79,13 +123,13 @@ if map_type == 'basemap':
 
 if map_type == 'cartopy': # use transform keyword
     map_setup() 
-    plt.contourf(lon,lat,np.mean(tcch4,axis=0),levels=clevs_ch4,
+    plt.contourf(lon,lat,bgc_tm['tcch4'],levels=clevs_ch4,
                  extend='both',transform=ccrs.PlateCarree(),cmap='PRGn_r')
     clb = plt.colorbar()
     clb.set_label(units['tcch4'])
 
 if map_type in ['nomap','basemap']: # no transform
-    plt.contourf(lon,lat,np.mean(tcch4,axis=0))
+    plt.contourf(lon,lat,bgc_tm['tcch4'])
 
 
 # Maps of monthly mean carbon dioxide
@@ -97,8 +141,8 @@ axs=axs.flatten()
 #Loop over all of the months
 for imon in range(12):
     
-    # Time average with N=12 stride
-    data = np.mean(tcco2[imon::12],axis=0)
+    # Monthly climatology
+    data = bgc_clim['tcco2'][imon]
 
     # Contour plot. This assumes no projection!
     cs=axs[imon].contourf(lon,lat,data,
@@ -115,27 +159,53 @@ for imon in range(12):
 plt.tight_layout()
 
 
-# Compute zonal and global means, area-weighting is required
-lat_wgt = np.cos(lat*np.pi/180.)
-tcco2_zm = np.mean(tcco2,axis=2)
-tcco2_gm = np.average(tcco2_zm,weights=lat_wgt,axis=1)
-tcch4_zm = np.mean(tcch4,axis=2)
-tcch4_gm = np.average(tcch4_zm,weights=lat_wgt,axis=1)
+# Global means (cos-lat weighted)
+tcco2_gm = bgc_gm['tcco2']
+tcch4_gm = bgc_gm['tcch4']
+
+# Running annual means, centred on the 12-month windows
+tim_ann = yyyy0+(np.arange(ntim-11)+5.5)/12.
+bgc_ann = {name:running_annual(bgc_gm[name]) for name in ['tcco2','tcch4']}
 
 plt.figure(figsize=(9,3))
 plt.subplot(1,2,1)
 plt.plot(yyyy0+np.arange(ntim)/12.,tcco2_gm,'k-')
+plt.plot(tim_ann,bgc_ann['tcco2'],'r-')
 plt.xlim([yyyy0,yyyy1])
 plt.ylabel(f"CO2 ({units['tcco2']})")
 plt.grid()
 plt.subplot(1,2,2)
 plt.plot(yyyy0+np.arange(ntim)/12.,tcch4_gm,'k-')
+plt.plot(tim_ann,bgc_ann['tcch4'],'r-')
 plt.xlim([yyyy0,yyyy1])
 plt.ylabel(f"CH4 ({units['tcch4']})")
 plt.grid()
 plt.tight_layout()
 
 
+# Trend maps (per year) of the deseasonalized CO2 and CH4, with
+# hatching where the trend is below two standard errors, and maps of
+# the mean annual growth rate (same month of consecutive years)
+trends = {}
+growth = {}
+if use_stream is not True:
+    plt.figure(figsize=(9,6))
+    for ivar, name in enumerate(['tcco2','tcch4']):
+        fit = trends[name] = trend_fit(bgc_stats[name]['anom'],deseason=False)
+        plt.subplot(2,2,ivar+1)
+        plt.contourf(lon,lat,fit['trend'],cmap='plasma')
+        plt.colorbar(orientation='horizontal',label=f"{units[name]}/yr")
+        plt.contourf(lon,lat,np.abs(fit['trend']) < 2*fit['stderr'],
+                     levels=[.5,1.5],hatches=['..'],colors='none')
+        plt.title(f'{name} trend')
+        growth[name] = np.mean(growth_rate(bgc_stats[name]['anom']),axis=0)
+        plt.subplot(2,2,ivar+3)
+        plt.contourf(lon,lat,growth[name],cmap='plasma')
+        plt.colorbar(orientation='horizontal',label=f"{units[name]}/yr")
+        plt.title(f'{name} growth rate')
+    plt.tight_layout()
+
+
 # Carbon dioxide fluxes
 
 # Values are adjusted depending on the variable
@@ -149,14 +219,14 @@ if map_type == 'basemap':
 
 if map_type == 'cartopy':
     map_setup() 
-    plt.contourf(lon,lat,np.mean(fco2nee,axis=0),levels=clevs_flux,
+    plt.contourf(lon,lat,bgc_tm['fco2nee'],levels=clevs_flux,
                  extend='both',transform=ccrs.PlateCarree(),cmap='PRGn_r')
     clb = plt.colorbar()
     clb.set_label(units['flux'])
     plt.title('Net ecosystem exchange')
 
 if map_type in ['nomap','basemap']:
-    plt.contourf(lon,lat,np.mean(fco2nee,axis=0))
+    plt.contourf(lon,lat,bgc_tm['fco2nee'])
 
 # Ocean fluxes
 plt.figure(figsize=(6,4))
@@ -167,14 +237,14 @@ if map_type == 'basemap':
 if map_type == 'cartopy': # use transform keyword
     #plt.subplot(2,1,1)
     map_setup() 
-    plt.contourf(lon,lat,np.mean(fco2oce,axis=0),levels=clevs_flux/10.,
+    plt.contourf(lon,lat,bgc_tm['co2of'],levels=clevs_flux/10.,
                  extend='both',transform=ccrs.PlateCarree(),cmap='PRGn_r')
     clb = plt.colorbar()
     clb.set_label(units['flux'])
     plt.title('Ocean')
 
 if map_type in ['nomap','basemap']: # no transform
-    plt.contourf(lon,lat,np.mean(fco2nee,axis=0))
+    plt.contourf(lon,lat,bgc_tm['fco2nee'])
  
 # Anthropogenic contribution
 plt.figure(figsize=(6,4))
@@ -185,22 +255,19 @@ if map_type == 'basemap':
 if map_type == 'cartopy': # use transform keyword
     #plt.subplot(2,1,1)
     map_setup() 
-    plt.contourf(lon,lat,np.mean(fco2ant,axis=0),levels=clevs_flux/10.,
+    plt.contourf(lon,lat,bgc_tm['co2apf'],levels=clevs_flux/10.,
                  extend='both',transform=ccrs.PlateCarree(),cmap='PRGn_r')
     clb = plt.colorbar()
     clb.set_label(units['flux'])
     plt.title('Anthropogenic')
 
 if map_type in ['nomap','basemap']: # no transform
-    plt.contourf(lon,lat,np.mean(fco2ant,axis=0))
+    plt.contourf(lon,lat,bgc_tm['co2apf'])
 
 # Time series of fluxes
-fnee_zm = np.mean(fco2nee,axis=2)
-fnee_gm = np.average(fnee_zm,weights=lat_wgt,axis=1)
-foce_zm = np.mean(fco2oce,axis=2)
-foce_gm = np.average(foce_zm,weights=lat_wgt,axis=1)
-fant_zm = np.mean(fco2ant,axis=2)
-fant_gm = np.average(fant_zm,weights=lat_wgt,axis=1)
+fnee_gm = bgc_gm['fco2nee']
+foce_gm = bgc_gm['co2of']
+fant_gm = bgc_gm['co2apf']
 
 plt.figure(figsize=(5,3))
 plt.plot(yyyy0+np.arange(ntim)/12.,fnee_gm,'g-',label='NEE')
@@ -212,4 +279,68 @@ plt.legend()
 plt.grid()
 plt.tight_layout()
 
+# Carbon budget (PgC/yr): land, ocean, anthropogenic fluxes and the
+# residual against the growth of the CO2 global mean
+budget = carbon_budget({kk:bgc_tot[vv] for kk, vv in budget_names.items()},
+                       yyyy0,bgc_gm['tcco2'])
+print('Year  nmon   land  ocean anthro  total growth resid (PgC/yr)')
+for iy, year in enumerate(budget['year']):
+    print('%4i %5i' % (year,budget['nmon'][iy])+
+          ''.join(' %6.2f' % budget[kk][iy] for kk in
+                  ['land','ocean','anthro','total','growth','residual']))
+
+plt.figure(figsize=(5,3))
+for kk, col in [('land','g'),('ocean','b'),('anthro','k'),('residual','r')]:
+    plt.plot(budget['year'],budget[kk],col+'o-',label=kk)
+plt.ylabel('PgC/yr')
+plt.axhline(0,color='k',linewidth=.5)
+plt.legend()
+plt.grid()
+plt.tight_layout()
+
+if make_batch is True:
+
+    # One spec per figure: time mean and monthly climatology maps of
+    # all the variables, global mean series, trends, growth rates and
+    # budget
+    tim_mon = yyyy0+np.arange(ntim)/12.
+    map_levs = {'tcco2':clevs_co2, 'tcch4':clevs_ch4, 'fco2nee':clevs_flux,
+                'co2of':clevs_flux/10., 'co2apf':clevs_flux/10.}
+    specs = []
+    for name in bgc_names:
+        uni = units.get(name,units['flux'])
+        specs.append({'fname':name+'_tm', 'x':lon, 'y':lat, 'z':bgc_tm[name],
+                      'levels':map_levs[name], 'cmap':'PRGn_r', 'extend':'both',
+                      'colorbar':'vertical', 'title':f'{name} time mean ({uni})',
+                      'figsize':(6,4)})
+        for imon in range(12):
+            specs.append({'fname':'%s_clim_m%02i' % (name,imon+1), 'x':lon, 'y':lat,
+                          'z':bgc_clim[name][imon], 'levels':map_levs[name],
+                          'cmap':'plasma', 'extend':'both', 'colorbar':'vertical',
+                          'title':f'{name} month = {imon+1} ({uni})', 'figsize':(6,4)})
+    for name in ['tcco2','tcch4']:
+        specs.append({'fname':name+'_gm', 'xlim':[yyyy0,yyyy1],
+                      'lines':[(tim_mon,bgc_gm[name],'k-',None),
+                               (tim_ann,bgc_ann[name],'r-',None)],
+                      'ylabel':f"{name} ({units[name]})", 'figsize':(5,3)})
+        if name in trends:
+            fit = trends[name]
+            specs.append({'fname':name+'_trend', 'x':lon, 'y':lat, 'z':fit['trend'],
+                          'cmap':'plasma', 'colorbar':'horizontal',
+                          'hatch':np.abs(fit['trend']) < 2*fit['stderr'],
+                          'title':f"{name} trend ({units[name]}/yr)"})
+        if name in growth:
+            specs.append({'fname':name+'_growth', 'x':lon, 'y':lat, 'z':growth[name],
+                          'cmap':'plasma', 'colorbar':'horizontal',
+                          'title':f"{name} growth rate ({units[name]}/yr)"})
+    specs.append({'fname':'flux_gm', 'xlim':[yyyy0,yyyy1], 'legend':True,
+                  'lines':[(tim_mon,fnee_gm,'g-','NEE'),(tim_mon,foce_gm*10,'b-','10x OCE'),
+                           (tim_mon,fant_gm*3,'k-','3x ANT')],
+                  'ylabel':f"CO2 fluxes ({units['flux']})", 'figsize':(5,3)})
+    specs.append({'fname':'carbon_budget', 'legend':True, 'hlines':[(0,'k')],
+                  'lines':[(budget['year'],budget[kk],col+'o-',kk) for kk, col in
+                           [('land','g'),('ocean','b'),('anthro','k'),('residual','r')]],
+                  'ylabel':'PgC/yr', 'figsize':(5,3)})
+    render_all(specs,batch_path)
+
 plt.show()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""
+Linear trends and growth rates at every grid point of monthly
+(time,lat,lon) fields, e.g. the EGG4 tcco2 and tcch4.
+
+The seasonal cycle is removed first (bgc_clim.anomalies), then all
+the grid points are fitted at once: with the (time,2) design matrix
+X = [1, t], the coefficients of the (time,lat*lon) matrix Y are
+pinv(X) @ Y, one matrix product, and the standard errors come from
+the residual variance of each column (ordinary least squares, no
+correction for autocorrelation).
+"""
+
+import numpy as np
+from bgc_clim import anomalies
+
+
+def trend_fit(var,dt=1./12.,deseason=True,ncycle=12):
+    """ Linear trend of `var` (time,...) per unit time (default: per
+    year, for monthly data), with its standard error, and the
+    intercept at the middle of the record: dict of (...) arrays.
+    Points with missing values get nan. """
+    var = np.asarray(var)
+    if deseason:
+        var = anomalies(var,ncycle=ncycle)
+    ntim = var.shape[0]
+    yy = var.reshape(ntim,-1).astype('f8')
+    tt = (np.arange(ntim)-(ntim-1)/2.)*dt # centred, better conditioned
+    xx = np.stack([np.ones(ntim),tt],axis=1)
+    coef = np.linalg.pinv(xx) @ yy
+    resid = yy - xx @ coef
+    s2 = np.sum(resid*resid,axis=0)/max(ntim-2,1)
+    cov = np.linalg.inv(xx.T @ xx)
+    shape = var.shape[1:]
+    return {'trend':coef[1].reshape(shape),
+            'stderr':np.sqrt(s2*cov[1,1]).reshape(shape),
+            'intercept':coef[0].reshape(shape)}
+
+
+def growth_rate(var,ncycle=12):
+    """ Annual growth rate (per year): differences between the same
+    month of consecutive years, (time-ncycle,...) """
+    var = np.asarray(var)
+    return var[ncycle:] - var[:-ncycle]
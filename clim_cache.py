@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""
+Persistent cache of derived fields (theta, thetae, statistics...).
+
+Each entry is a directory of .npy files, named after a key built from
+the identity of the input files (path, size, modification time, or a
+content hash) and from the parameters used (e.g. rcp, l_e, cp).
+Arrays are loaded back as read-only memory maps, so that a warm
+rerun only touches the pages it actually uses. Large arrays can also
+be written chunk by chunk (see CacheWriter.array). When the total
+size exceeds `maxbytes`, the least recently used entries are removed.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+
+
+# Identity of an input file: path, size and mtime, or (if `content`)
+# a hash of the whole file
+def file_id(path,content=False):
+    path = os.path.abspath(path)
+    if content:
+        md5 = hashlib.md5()
+        with open(path,'rb') as ff:
+            for block in iter(lambda: ff.read(2**24),b''):
+                md5.update(block)
+        return [path,md5.hexdigest()]
+    stat = os.stat(path)
+    return [path,stat.st_size,stat.st_mtime_ns]
+
+
+def cache_key(paths,content=False,**params):
+    """ Key of the files `paths` processed with `params` """
+    ident = {'files':[file_id(pp,content) for pp in paths],
+             'params':{kk:repr(vv) for kk, vv in sorted(params.items())}}
+    return hashlib.sha1(json.dumps(ident,sort_keys=True).encode()).hexdigest()
+
+
+# Nested dicts of arrays (e.g. stats['tran'][('v','t')]) <-> flat
+# names ('tran.v.t') usable as file names
+def flatten(arrays,prefix=''):
+    flat = {}
+    for kk, vv in arrays.items():
+        name = prefix+('.'.join(kk) if isinstance(kk,tuple) else kk)
+        if isinstance(vv,dict):
+            flat.update(flatten(vv,name+'/'))
+        else:
+            flat[name] = vv
+    return flat
+
+
+def unflatten(flat):
+    arrays = {}
+    for name, vv in flat.items():
+        path = name.split('/')
+        node = arrays
+        for pp in path[:-1]:
+            node = node.setdefault(pp,{})
+        kk = path[-1]
+        node[tuple(kk.split('.')) if '.' in kk else kk] = vv
+    return arrays
+
+
+class CacheWriter:
+    """ A cache entry being written (in a temporary directory, moved
+    in place by `commit`, so that partial entries are never read) """
+
+    def __init__(self,cache,key):
+        self.cache = cache
+        self.key = key
+        self.tmp = os.path.join(cache.path,'.tmp_'+key+'_'+str(os.getpid()))
+        os.makedirs(self.tmp,exist_ok=True)
+
+    def _fname(self,name):
+        return os.path.join(self.tmp,name.replace('/','~')+'.npy')
+
+    def array(self,name,shape,dtype='f'):
+        """ Writable memory-mapped array, to be filled by chunks """
+        return np.lib.format.open_memmap(self._fname(name),mode='w+',
+                                         dtype=dtype,shape=shape)
+
+    def save(self,arrays):
+        """ Save a (nested) dict of arrays """
+        for name, vv in flatten(arrays).items():
+            np.save(self._fname(name),np.asarray(vv))
+
+    def commit(self):
+        dest = os.path.join(self.cache.path,self.key)
+        if os.path.isdir(dest):
+            shutil.rmtree(dest)
+        os.replace(self.tmp,dest)
+        self.cache.touch(self.key)
+        self.cache.evict(keep=self.key)
+
+    def abort(self):
+        shutil.rmtree(self.tmp,ignore_errors=True)
+
+
+class DiskCache:
+    """ Directory of cache entries, with a total size cap """
+
+    def __init__(self,path='./clim_cache/',maxbytes=8*2**30):
+        self.path = path
+        self.maxbytes = maxbytes
+        os.makedirs(path,exist_ok=True)
+
+    def _entries(self):
+        return [kk for kk in os.listdir(self.path)
+                if not kk.startswith('.') and
+                os.path.isdir(os.path.join(self.path,kk))]
+
+    def touch(self,key):
+        stamp = os.path.join(self.path,key,'.last_used')
+        with open(stamp,'a'):
+            pass
+        now = time.time()
+        os.utime(stamp,(now,now))
+
+    def get(self,key,mmap_mode='r'):
+        """ Nested dict of (memory mapped) arrays, or None if missing """
+        dest = os.path.join(self.path,key)
+        if not os.path.isdir(dest):
+            return None
+        flat = {}
+        for fname in os.listdir(dest):
+            if fname.endswith('.npy'):
+                flat[fname[:-4].replace('~','/')] = \
+                    np.load(os.path.join(dest,fname),mmap_mode=mmap_mode)
+        self.touch(key)
+        return unflatten(flat)
+
+    def writer(self,key):
+        return CacheWriter(self,key)
+
+    def put(self,key,arrays):
+        writer = self.writer(key)
+        writer.save(arrays)
+        writer.commit()
+
+    def size(self,key):
+        dest = os.path.join(self.path,key)
+        return sum(os.path.getsize(os.path.join(dest,ff)) for ff in os.listdir(dest))
+
+    def evict(self,keep=None):
+        """ Remove least recently used entries until under maxbytes """
+        def last_used(key):
+            stamp = os.path.join(self.path,key,'.last_used')
+            return os.path.getmtime(stamp) if os.path.exists(stamp) else 0.
+        entries = sorted(self._entries(),key=last_used)
+        total = sum(self.size(kk) for kk in entries)
+        for key in entries:
+            if total <= self.maxbytes:
+                break
+            if key == keep:
+                continue
+            total -= self.size(key)
+            shutil.rmtree(os.path.join(self.path,key),ignore_errors=True)
+
+    def clear(self):
+        for key in self._entries():
+            shutil.rmtree(os.path.join(self.path,key),ignore_errors=True)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""
+Multi-year climatologies from many (e.g. yearly) netCDF files.
+
+Each file is reduced by a worker process to the running sums of
+clim_stat.StatAccum (means, zonal means, cross products), and the
+partial sums are merged as they come back. The merge is associative,
+so the result does not depend on the number of workers and, for a
+single file, matches the one of stream_stat (i.e. of `comp_stat`).
+Zonal means are kept per calendar month (ncycle=12) by default.
+"""
+
+from nc_lazy import LazyDataset, open_nc
+from clim_stat import stream_stat
+from proc_pool import pool_imap
+
+
+# Statistics of one file; `t0` is the index of its first time step
+# in the whole record (to place its months in the calendar cycle)
+def file_stat(args):
+    path, t0, varmap, pairs, derive, names, nchunk, ncycle = args
+    ds = LazyDataset(path,maxbytes=0) # no slab cache, each chunk read once
+    sources = {name:ds[var] for name, var in varmap.items()}
+    acc = stream_stat(sources,pairs,derive,nchunk,ncycle,names)
+    # Time indices are global, shift them from file to record
+    if ncycle is None:
+        acc.zsum = {(kk[0],kk[1]+t0):vv for kk, vv in acc.zsum.items()}
+        acc.zcnt = {(kk[0],kk[1]+t0):vv for kk, vv in acc.zcnt.items()}
+    elif t0 % ncycle != 0:
+        shift = lambda kk: (kk[0],(kk[1]+t0) % ncycle)
+        acc.zsum = {shift(kk):vv for kk, vv in acc.zsum.items()}
+        acc.zcnt = {shift(kk):vv for kk, vv in acc.zcnt.items()}
+    acc.nt += t0
+    ds.clear()
+    return acc
+
+
+def build_clim(paths,varmap,pairs=(),derive=None,names=None,nchunk=1,
+               ncycle=12,nproc=None,tim_name=None):
+    """ StatAccum of all the files in `paths` (in time order).
+    `varmap` maps field names to file variables, e.g. {'t':'t','v':'v'},
+    `derive`, `names`, `nchunk` and `ncycle` are as in stream_stat
+    (`derive` must be picklable, e.g. a functools.partial). """
+    # Time offsets of the files
+    var0 = next(iter(varmap.values()))
+    ntims = [open_nc(pp).variables[var0].shape[0] for pp in paths]
+    t0s = [sum(ntims[:ii]) for ii in range(len(paths))]
+    args = [(pp,t0,varmap,pairs,derive,names,nchunk,ncycle)
+            for pp, t0 in zip(paths,t0s)]
+    # Associative reduction of the partial sums, in arrival order
+    acc = None
+    for part in pool_imap(file_stat,args,nproc,ordered=False):
+        acc = part if acc is None else acc.merge(part)
+    return acc
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+"""
+One-pass climatological statistics on (time,lev,lat,lon) fields.
+
+Replaces `comp_stat`, which returned the prime (time deviation) and
+star (zonal deviation) anomalies as full copies of the input. Here the
+data are read once, a few time steps at a time, and only running sums
+are kept:
+ - sums over time (lev,lat,lon) -> annual means `am`
+ - zonal means per time step (or per calendar slot) -> `zm`
+ - sums over time of products a*b -> transient eddy covariances
+From these, for each pair (a,b), the three terms of the meridional
+transport decomposition (Peixoto and Oort 1992, ch. 13) follow:
+ - transient eddies     [ (a'b')~ ]  = [ (ab)~ - a~ b~ ]
+ - stationary eddies    [ a~* b~* ]
+ - mean circulation     [ a~ ] [ b~ ]
+where ~ is the time mean, [] the zonal mean, ' and * the deviations.
+
+Masked arrays (numpy.ma) are supported: masked points are excluded
+from sums and counts, as the numpy.ma means would do. A faster path
+is available for nan-encoded fields with a fixed (lev,lat,lon) mask
+of valid points (e.g. the sea points, see ocean_mask.py), given by
+`masks`: then the counts come from the mask, not from each chunk.
+"""
+
+import numpy as np
+
+
+# Data and valid points of a chunk (masked values -> 0). A static
+# `mask` (no time axis) is used as is, otherwise the numpy.ma mask
+def _split_mask(xx,mask=None):
+    if mask is not None:
+        return np.where(mask,xx,np.float32(0)), mask
+    if np.ma.isMaskedArray(xx):
+        valid = ~np.ma.getmaskarray(xx)
+        return np.ma.getdata(xx)*valid, valid
+    return np.asarray(xx), None
+
+
+# Number of valid points over time (valid can be static)
+def _tcount(valid,nt,ndim):
+    if valid is None:
+        return nt
+    if valid.ndim < ndim:
+        return nt*valid.astype('i4')
+    return np.sum(valid,axis=0)
+
+
+# Sum over time and number of valid points
+def _tsum(xx,valid):
+    ssum = np.sum(xx,axis=0,dtype='f8')
+    return ssum, _tcount(valid,xx.shape[0],xx.ndim)
+
+
+# Ratio of sums and counts, nan where no data
+def _ratio(ssum,nval):
+    with np.errstate(invalid='ignore',divide='ignore'):
+        return np.where(np.asarray(nval) > 0,ssum/np.maximum(nval,1),np.nan)
+
+
+# Sums and counts over the points of each basin, for a (nb,lat,lon)
+# `bmask`: (...,lat,lon) -> (nb,...,lat), all basins in one einsum.
+# With `per_basin`, xx already has a leading basin axis.
+def _bsum(xx,valid,bmask,per_basin=False):
+    wgt = bmask.astype('f8')
+    sub = 'b...yx,byx->b...y' if per_basin else '...yx,byx->b...y'
+    ssum = np.einsum(sub,xx,wgt,dtype='f8')
+    if valid is None:
+        nval = np.sum(bmask,axis=-1)
+        return ssum, nval.reshape(nval.shape[:1]+(1,)*(ssum.ndim-2)+nval.shape[1:])
+    nval = np.einsum(sub,valid,wgt,dtype='f8')
+    if nval.ndim < ssum.ndim: # static mask, no time axis
+        nval = nval[:,None]
+    return ssum, nval
+
+
+def zonal_mean(xx,bmask=None,per_basin=False):
+    """ Zonal (last axis) mean ignoring nans, nan where no valid
+    points. With a (nb,lat,lon) basin mask, mean over the points of
+    each basin, on a new leading axis. """
+    valid = np.isfinite(xx)
+    x0 = np.where(valid,xx,0.)
+    if bmask is None:
+        return _ratio(np.sum(x0,axis=-1),np.sum(valid,axis=-1))
+    return _ratio(*_bsum(x0,valid,bmask,per_basin))
+
+
+class StatAccum:
+    """ Running sums for annual/zonal means and eddy covariances.
+    `names` are the fields, `pairs` a list of (a,b) names whose
+    covariances are needed. If `ncycle` is given (e.g. 12), zonal
+    means are accumulated per calendar slot (t % ncycle), otherwise
+    one per time step as in `comp_stat`. `masks` are the static masks
+    of valid points of nan-encoded fields, by name. With `bmask`, a
+    (nb,lat,lon) mask of basins/sectors, all zonal means are taken
+    over each basin (leading axis of 'zm', 'tran', 'stat', 'mean'). """
+
+    def __init__(self,names,pairs=(),ncycle=None,masks=None,bmask=None):
+        self.names = list(names)
+        self.masks = masks or {}
+        self.bmask = bmask
+        self.pairs = [tuple(pp) for pp in pairs]
+        self.groups = {}
+        for pp in self.pairs:
+            self.groups.setdefault(pp[0],[]).append(pp[1])
+        self.ncycle = ncycle
+        self.nt = 0
+        self.tsum = {}; self.tcnt = {}
+        self.psum = {}; self.pcnt = {}
+        self.zsum = {}; self.zcnt = {}
+
+    def _acc(self,dsum,dcnt,key,ssum,nval):
+        if key in dsum:
+            dsum[key] += ssum
+            dcnt[key] = dcnt[key] + nval
+        else:
+            dsum[key] = ssum
+            dcnt[key] = nval
+
+    def add(self,chunk,t0=None):
+        """ Add a dict {name: (nt,lev,lat,lon) array}; `t0` is the
+        time index of the first step (default: continue from last) """
+        if t0 is None:
+            t0 = self.nt
+        nt = chunk[self.names[0]].shape[0]
+        slots = np.arange(t0,t0+nt)
+        if self.ncycle is not None:
+            slots = slots % self.ncycle
+        split = {}
+        for name in self.names:
+            xx, valid = _split_mask(chunk[name],self.masks.get(name))
+            split[name] = (xx,valid)
+            self._acc(self.tsum,self.tcnt,name,*_tsum(xx,valid))
+            # Zonal means of each time step
+            if self.bmask is not None:
+                zm = np.moveaxis(_ratio(*_bsum(xx,valid,self.bmask)),0,1)
+            elif valid is None:
+                zm = np.mean(xx,axis=-1,dtype='f8')
+            else:
+                zm = _ratio(np.sum(xx,axis=-1,dtype='f8'),np.sum(valid,axis=-1))
+            for it, slot in enumerate(slots):
+                self._acc(self.zsum,self.zcnt,(name,int(slot)),zm[it],1)
+        # Cross products, grouped by first field (e.g. a velocity): the
+        # velocity chunk is multiplied by all its tracers at once
+        for name_a, names_b in self.groups.items():
+            xa, va = split[name_a]
+            xb = np.stack([split[nb][0] for nb in names_b])
+            prod = np.sum(xa[None]*xb,axis=1,dtype='f8')
+            for kk, nb in enumerate(names_b):
+                vb = split[nb][1]
+                valid = va if vb is None else (vb if va is None else va & vb)
+                nval = _tcount(valid,nt,xa.ndim)
+                self._acc(self.psum,self.pcnt,(name_a,nb),prod[kk],nval)
+        self.nt = max(self.nt,t0+nt)
+        return self
+
+    def merge(self,other):
+        """ Combine with the sums of another accumulator (associative) """
+        for key in other.tsum:
+            self._acc(self.tsum,self.tcnt,key,other.tsum[key],other.tcnt[key])
+        for key in other.psum:
+            self._acc(self.psum,self.pcnt,key,other.psum[key],other.pcnt[key])
+        for key in other.zsum:
+            self._acc(self.zsum,self.zcnt,key,other.zsum[key],other.zcnt[key])
+        self.nt = max(self.nt,other.nt)
+        return self
+
+    def result(self,dtype='f'):
+        """ Return a dict of dicts: 'am' and 'zm' by name, 'tran',
+        'stat' and 'mean' by pair. Missing data are nan. """
+        res = {'am':{}, 'zm':{}, 'tran':{}, 'stat':{}, 'mean':{}}
+        for name in self.names:
+            res['am'][name] = _ratio(self.tsum[name],self.tcnt[name]).astype(dtype)
+            slots = sorted(kk[1] for kk in self.zsum if kk[0] == name)
+            res['zm'][name] = np.array([_ratio(self.zsum[(name,ss)],
+                                               self.zcnt[(name,ss)])
+                                        for ss in slots],dtype=dtype)
+            if self.bmask is not None: # basin first
+                res['zm'][name] = np.moveaxis(res['zm'][name],1,0)
+        # Zonal means and star deviations of the time means, computed
+        # once per field and shared by all the pairs using it
+        am_zm, am_ss = {}, {}
+        bm = self.bmask
+        for name in set(sum(self.pairs,())):
+            am_zm[name] = zonal_mean(res['am'][name],bm)
+            am_ss[name] = res['am'][name] - am_zm[name][...,None]
+        for pp in self.pairs:
+            am_a, am_b = res['am'][pp[0]], res['am'][pp[1]]
+            cov = _ratio(self.psum[pp],self.pcnt[pp]) - am_a*am_b
+            res['tran'][pp] = zonal_mean(cov,bm).astype(dtype)
+            res['stat'][pp] = zonal_mean(am_ss[pp[0]]*am_ss[pp[1]],bm,
+                                         bm is not None).astype(dtype)
+            res['mean'][pp] = (am_zm[pp[0]]*am_zm[pp[1]]).astype(dtype)
+        return res
+
+
+def stream_stat(sources,pairs=(),derive=None,nchunk=1,ncycle=None,names=None,
+                masks=None,bmask=None):
+    """ Read `sources` ({name: array or lazy variable}) `nchunk` time
+    steps at a time and accumulate their statistics. `derive` is an
+    optional function adding derived fields to each chunk dict (e.g.
+    theta), called as derive(chunk,t0) with t0 the index of the first
+    time step; `names` are the fields to keep (default: all), `masks`
+    the static masks of nan-encoded fields and `bmask` the basin masks
+    (see StatAccum). """
+    ntim = len(next(iter(sources.values())))
+    acc = None
+    for t0 in range(0,ntim,nchunk):
+        t1 = min(t0+nchunk,ntim)
+        chunk = {name:src[t0:t1] for name, src in sources.items()}
+        if derive is not None:
+            derive(chunk,t0)
+        if acc is None:
+            acc = StatAccum(names or list(chunk),pairs,ncycle,masks,bmask)
+        acc.add(chunk,t0)
+    return acc
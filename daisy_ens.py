@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+"""
+Daisyworld ensembles: many parameter sets advanced in lockstep.
+
+The model is the one of daisyworld.py (same growth function, death
+rate, 0.01 floor of the daisy fractions, greenhouse effect of prad,
+local daisy temperatures), but every quantity is an array over the
+ensemble members, and the scalar if/min of the original loop become
+np.where/np.minimum. The parameters (albedos, prad0, perc_ghg, gam,
+dl) are float32 arrays, as the state, so that a single member
+follows daisyworld.py to float32 rounding (powers of arrays and of
+scalars can differ in the last bit).
+"""
+
+import numpy as np
+
+
+sigma = 5.67*1E-08 # Boltzmann constant
+rcp = 0.278 # R/cp
+
+# Albedos (black, white, bare soil) of the populations of daisyworld.py
+populations = {'mix':(0.25,0.75,0.50), 'neutral':(0.50,0.50,0.50),
+               'black':(0.25,0.25,0.50), 'white':(0.75,0.75,0.50)}
+
+# Default parameters of daisyworld.py
+daisy_defaults = {'bd_a':0.25, 'wd_a':0.75, 'bs_a':0.50, 'prad0':850.,
+                  'perc_ghg':1E-5, 'gam':0.3, 'dl':2*1E-04, 'l_o':1400.}
+
+
+def daisy_params(nens=None,population=None,**params):
+    """ Dict of (nens,) parameter arrays; `params` can be scalars or
+    arrays (e.g. prad0=np.linspace(500,1000,100)), the albedos can be
+    taken from a `population` name. Arrays are broadcast together
+    (use np.meshgrid for full factorial sweeps). """
+    pars = dict(daisy_defaults)
+    if population is not None:
+        pars['bd_a'], pars['wd_a'], pars['bs_a'] = populations[population]
+    pars.update(params)
+    shape = np.broadcast(*[np.asarray(vv) for vv in pars.values()]).shape
+    if nens is not None:
+        shape = np.broadcast_shapes(shape,(nens,))
+    # l_o and dl set the luminosity, kept in float64 as in daisyworld.py
+    return {kk:np.broadcast_to(np.asarray(vv,dtype='f8' if kk in ('l_o','dl') else 'f'),
+                               shape).ravel()
+            for kk, vv in pars.items()}
+
+
+# Growth function of the daisies (0 outside 5-40 degC)
+def growth(t_loc):
+    return np.where(np.logical_and(t_loc > 5,t_loc < 40),
+                    1 - 0.003265*((22.5-t_loc)**2),0.)
+
+
+# Planet temperature (degC) for the albedo aa: radiative temperature
+# (K), optionally transformed by `t_rad` (e.g. a diffusion between
+# latitude bands), then greenhouse effect of prad
+def planet_temp(l_a,aa,prad,t_rad=None):
+    t_r = np.float32(((l_a*(1-aa)/sigma)**0.25) - 273.)+273
+    if t_rad is not None:
+        t_r = t_rad(t_r)
+    return (t_r*((1000./prad)**rcp))-273.
+
+
+# Local temperature (degC) of daisies of albedo `alb` (scalar or array)
+# on a planet of albedo aa and temperature t_d
+def local_temp(l_a,aa,t_d,alb):
+    qq = 0.2 * l_a / sigma
+    return ((qq*(aa-alb)+(t_d+273.)**4.)**0.25) - 273.
+
+
+# Temperatures of a state: planet, black and white daisies (degC)
+def temperatures(l_a,aa,bd,wd,prad,pp,floor=0.01,t_rad=None):
+    t_d = planet_temp(l_a,aa,prad,t_rad)
+    t_wd = np.where(wd > floor,local_temp(l_a,aa,t_d,pp['wd_a']),t_d)
+    t_bd = np.where(bd > floor,local_temp(l_a,aa,t_d,pp['bd_a']),t_d)
+    return t_d, t_bd.astype('f'), t_wd.astype('f')
+
+
+# One time step of all the members, from state `ss` at luminosity l_a.
+# `cover` reduces the daisy cover driving prad (default: per member,
+# e.g. a mean over latitude bands), `t_rad` is as in planet_temp.
+def daisy_step(ss,l_a,pp,dt=1,floor=0.01,cover=None,t_rad=None):
+    xx = ss['xx']
+    bd = ss['bd'] + (ss['bd']*growth(ss['t_bd'])*xx - ss['bd']*pp['gam'])*dt
+    bd = np.maximum(bd,np.float32(floor))
+    wd = ss['wd'] + (ss['wd']*growth(ss['t_wd'])*xx - ss['wd']*pp['gam'])*dt
+    wd = np.maximum(wd,np.float32(floor))
+    xx = 1. - bd - wd
+    aa = (xx*pp['bs_a']) + (pp['bd_a']*bd) + (pp['wd_a']*wd)
+    cov = bd+wd if cover is None else cover(bd+wd)
+    prad = np.minimum(1000,ss['prad']*(1.+(pp['perc_ghg']*cov)))
+    t_d, t_bd, t_wd = temperatures(l_a,aa,bd,wd,prad,pp,floor,t_rad)
+    return {'bd':bd,'wd':wd,'xx':xx,'aa':aa,'prad':prad,
+            't_d':t_d,'t_bd':t_bd,'t_wd':t_wd}
+
+
+def daisy_init(pp,l_a0,bd0=0.01,wd0=0.01):
+    """ Initial state of daisyworld.py (bare soil albedo) """
+    nens = len(pp['gam'])
+    bd = np.full(nens,bd0,dtype='f')
+    wd = np.full(nens,wd0,dtype='f')
+    aa = np.array(pp['bs_a'],dtype='f')
+    t_r = (((l_a0*(1-aa)/sigma)**0.25)-273.).astype('f')
+    fac = ((1000./pp['prad0'].astype('f8'))**rcp).astype('f')
+    t_d = (((t_r+273)*fac)-273.).astype('f')
+    return {'bd':bd,'wd':wd,'xx':(1.-bd-wd).astype('f'),'aa':aa,
+            'prad':np.array(pp['prad0'],dtype='f'),
+            't_d':t_d,'t_bd':t_d.copy(),'t_wd':t_d.copy()}
+
+
+def luminosity(pp,it):
+    """ Stellar luminosity (W/m2) of the members at step `it` """
+    return (0.2+it*pp['dl'])*pp['l_o']
+
+
+def run_ens(pp,ns=5000,dt=1,floor=0.01,save=('bd','wd','t_d'),every=10):
+    """ Ramp of luminosity over `ns` steps for all the members of the
+    parameter dict `pp` (see daisy_params). Returns the (nsave,nens)
+    histories of the fields `save`, every `every` steps (every=1 for
+    the full histories), 'l_a', and the 'final' state of all the
+    fields. """
+    ss = daisy_init(pp,luminosity(pp,0))
+    steps = np.arange(0,ns,every)
+    out = {kk:np.empty((len(steps),len(pp['gam'])),dtype='f') for kk in save}
+    out['l_a'] = (0.2+steps[:,None]*pp['dl'])*pp['l_o']
+    for kk in save:
+        out[kk][0] = ss[kk]
+    for it in range(1,ns):
+        ss = daisy_step(ss,luminosity(pp,it),pp,dt,floor)
+        if it % every == 0:
+            for kk in save:
+                out[kk][it//every] = ss[kk]
+    out['final'] = ss
+    return out
+
+
+def equilibrium(ss,l_a,pp,tol=1E-6,maxit=5000,dt=1,floor=0.01,period=64,
+                fix_prad=True):
+    """ Iterate the members at fixed luminosity `l_a` until the daisy
+    fractions repeat to within `tol`, after 1 to `period` steps (near
+    the 0.01 floor the switch of the local temperatures gives short
+    cycles instead of a fixed point). With `fix_prad`, prad is held
+    constant (its growth has no steady state below the 1000 mbar cap).
+    Converged members are left out of the following iterations, and
+    the loop stops when all have converged. Returns the new state and
+    the iterations per member. """
+    nens = len(pp['gam'])
+    ss = {kk:np.array(vv) for kk, vv in ss.items()}
+    if fix_prad:
+        pp = dict(pp,perc_ghg=np.zeros(nens,dtype='f'))
+    l_a = np.broadcast_to(l_a,(nens,))
+    niter = np.zeros(nens,dtype=int)
+    hist = np.full((period,2,nens),np.nan,dtype='f') # last bd, wd
+    hist[0] = ss['bd'], ss['wd']
+    active = np.arange(nens)
+    for it in range(1,maxit+1):
+        sub = {kk:vv[active] for kk, vv in ss.items()}
+        new = daisy_step(sub,l_a[active],{kk:vv[active] for kk, vv in pp.items()},
+                         dt,floor)
+        last = hist[:,:,active]
+        cur = np.stack([new['bd'],new['wd']])
+        change = np.nanmin(np.max(np.abs(cur[None]-last),axis=1),axis=0)
+        for kk in ss:
+            ss[kk][active] = new[kk]
+        hist[it % period,:,active] = cur.T
+        niter[active] += 1
+        active = active[~(change < tol)]
+        if len(active) == 0:
+            break
+    return ss, niter
+
+
+def hysteresis(pp,l_vals,tol=1E-6,maxit=5000,dt=1,floor=0.01,
+               save=('bd','wd','xx','aa','t_d','prad'),fix_prad=True):
+    """ Equilibria of all the members for the luminosities `l_vals`
+    (W/m2), swept upward and then downward, each equilibrium starting
+    from the previous one. Returns {'l_a', 'up', 'down'}, with the
+    (nl,nens) fields `save` of each branch and their iterations. """
+    l_vals = np.asarray(l_vals,dtype='f8')
+    ss = daisy_init(pp,l_vals[0])
+    res = {'l_a':l_vals}
+    for branch, order in [('up',np.arange(len(l_vals))),
+                          ('down',np.arange(len(l_vals))[::-1])]:
+        out = {kk:np.empty((len(l_vals),len(pp['gam'])),dtype='f') for kk in save}
+        out['niter'] = np.zeros((len(l_vals),len(pp['gam'])),dtype=int)
+        for il in order:
+            ss, out['niter'][il] = equilibrium(ss,l_vals[il],pp,tol,maxit,dt,floor,
+                                                fix_prad=fix_prad)
+            for kk in save:
+                out[kk][il] = ss[kk]
+        res[branch] = out
+    return res
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Daisyworld in latitude bands, with diffusive heat exchange.
+
+The bands are equal-area (uniform in x = sin(lat)), so that global
+means are plain means over the bands. Each band j receives the
+luminosity l_a s(x_j), with the annual-mean insolation profile
+s(x) = 1 + s2 (3x^2-1)/2 (s2 = -0.482, global mean 1), and has its
+own daisies, albedo and local temperatures: the step is the one of
+daisy_ens.daisy_step, given the diffusion and the global prad. The
+radiative temperatures of the bands are mixed by an implicit
+diffusion step, (I - kappa L) T = T_r, with L the (tridiagonal)
+diffusion operator d/dx (1-x^2) dT/dx, no flux at the poles. The
+operator is constant, so its inverse is computed once per (nlat,
+kappa) and cached: each step is then one matrix product for all the
+bands and all the ensemble members at once. The greenhouse factor
+of prad (global, driven by the global daisy cover) is applied after
+the diffusion, as in daisyworld.py. With kappa large the bands share
+a single temperature; with kappa = 0 each band is a 0D daisyworld.
+"""
+
+from functools import lru_cache
+import numpy as np
+from daisy_ens import planet_temp, daisy_step, luminosity
+
+
+s2 = -0.482 # second Legendre coefficient of the annual insolation
+
+
+def band_coords(nlat):
+    """ Centres x = sin(lat) and latitudes (deg) of `nlat` equal-area
+    bands """
+    xx = -1.+(np.arange(nlat)+0.5)*2./nlat
+    return xx, np.arcsin(xx)*180./np.pi
+
+
+def insolation(xx):
+    """ Annual-mean insolation profile (global mean 1) """
+    return 1.+s2*(3.*xx*xx-1.)/2.
+
+
+@lru_cache(maxsize=16)
+def _diff_inv(nlat,kappa):
+    dx = 2./nlat
+    xe = -1.+np.arange(1,nlat)*dx # interfaces between bands
+    cc = kappa*(1.-xe*xe)/(dx*dx)
+    # Banded (tridiagonal) I - kappa L, conserving the band mean
+    mat = np.eye(nlat)
+    mat[np.arange(nlat-1),np.arange(1,nlat)] -= cc
+    mat[np.arange(1,nlat),np.arange(nlat-1)] -= cc
+    mat[np.arange(nlat-1),np.arange(nlat-1)] += cc
+    mat[np.arange(1,nlat),np.arange(1,nlat)] += cc
+    inv = np.linalg.inv(mat).astype('f')
+    inv.setflags(write=False)
+    return inv
+
+
+def diffusion_inv(nlat,kappa):
+    """ (nlat,nlat) inverse of the implicit diffusion operator, cached """
+    return _diff_inv(int(nlat),float(kappa))
+
+
+# Global daisy cover of the members (equal-area bands)
+def _band_mean(cover):
+    return np.mean(cover,axis=0)
+
+
+def lat_step(ss,l_b,pp,inv,dt=1,floor=0.01):
+    """ One step of the (nlat,nens) state `ss` at the band luminosities
+    l_b: the step of daisy_ens, with prad driven by the global cover
+    and the radiative temperatures diffused between the bands """
+    return daisy_step(ss,l_b,pp,dt,floor,cover=_band_mean,
+                      t_rad=lambda t_r: inv @ t_r)
+
+
+def lat_init(pp,l_b,inv,bd0=0.01,wd0=0.01):
+    """ Initial state: bare soil in all the bands """
+    shape = np.shape(l_b)
+    bd = np.full(shape,bd0,dtype='f')
+    wd = np.full(shape,wd0,dtype='f')
+    aa = np.broadcast_to(pp['bs_a'],shape).astype('f')
+    prad = np.array(pp['prad0'],dtype='f')
+    t_d = planet_temp(l_b,aa,prad,t_rad=lambda t_r: inv @ t_r).astype('f')
+    return {'bd':bd,'wd':wd,'xx':(1.-bd-wd).astype('f'),'aa':aa,'prad':prad,
+            't_d':t_d,'t_bd':t_d.copy(),'t_wd':t_d.copy()}
+
+
+def run_lat(pp,nlat=90,ns=5000,kappa=0.05,dt=1,floor=0.01,
+            save=('bd','wd','aa','t_d'),every=1):
+    """ Luminosity ramp of daisyworld.py for `nlat` bands and all the
+    members of `pp` (see daisy_ens.daisy_params). Returns the
+    (nsave,nlat,nens) histories of the band fields `save`, every
+    `every` steps, the global (nsave,nens) 'prad' and 'l_a', and the
+    band latitudes 'lat'. """
+    xx, lat = band_coords(nlat)
+    sol = insolation(xx)[:,None]
+    inv = diffusion_inv(nlat,kappa)
+    nens = len(pp['gam'])
+    ss = lat_init(pp,sol*luminosity(pp,0)[None],inv)
+    steps = np.arange(0,ns,every)
+    out = {kk:np.empty((len(steps),nlat,nens),dtype='f') for kk in save}
+    out['prad'] = np.empty((len(steps),nens),dtype='f')
+    out['l_a'] = (0.2+steps[:,None]*pp['dl'])*pp['l_o']
+    out['lat'] = lat
+    for it in range(ns):
+        if it > 0:
+            ss = lat_step(ss,sol*luminosity(pp,it)[None],pp,inv,dt,floor)
+        if it % every == 0:
+            for kk in list(save)+['prad']:
+                out[kk][it//every] = ss[kk]
+    return out
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Daisyworld with N daisy species, in vector/matrix form.
+
+Each species i has its albedo alb_i, optimum temperature t_opt_i and
+growth width w_i: the growth function of daisyworld.py,
+  beta_i = 1 - 0.003265 (17.5/w_i)^2 (t_opt_i - T_i)^2,  |T_i - t_opt_i| < w_i
+(0 outside), which is the original one for t_opt = 22.5, w = 17.5.
+With the fractions a (N,), the bare ground is x = 1 - sum(a), the
+planetary albedo x bs_a + alb.a, and the local temperatures follow
+T_i^4 = q (A - alb_i) + T_d^4 (T_d for species at the floor), as in
+daisyworld.py. Species compete for the bare ground through the (N,N)
+matrix `comp`: the ground available to species i is x - (comp a)_i
+(comp = 0 is the original model), so
+  a_i <- a_i + (a_i beta_i (x - (comp a)_i) - gam a_i) dt
+with the 0.01 floor. Two species with albedos 0.25/0.75 and no
+competition give the 'mix' population of daisyworld.py.
+"""
+
+import numpy as np
+from daisy_ens import sigma, rcp, planet_temp, local_temp
+
+
+def species_params(alb,t_opt=22.5,width=17.5,bs_a=0.50,gam=0.3,comp=None):
+    """ Parameters of N species: `alb`, `t_opt`, `width` are (N,)
+    arrays or scalars, `comp` an (N,N) competition matrix """
+    alb = np.asarray(alb,dtype='f')
+    width = np.broadcast_to(np.asarray(width,dtype='f8'),alb.shape)
+    return {'alb':alb,
+            't_opt':np.broadcast_to(np.asarray(t_opt,dtype='f'),alb.shape),
+            'width':width.astype('f'),
+            'curv':(0.003265*(17.5/width)**2).astype('f'),
+            'bs_a':np.float32(bs_a), 'gam':np.float32(gam),
+            'comp':None if comp is None else np.asarray(comp,dtype='f')}
+
+
+# Growth function of all the species at their local temperatures
+def growth(t_loc,sp):
+    dev = sp['t_opt']-t_loc
+    return np.where(np.abs(dev) < sp['width'],1 - sp['curv']*(dev**2),0.)
+
+
+# Planetary and local temperatures (degC) for fractions `aa_sp`, by
+# the formulas of daisy_ens over the vector of albedos
+def temperatures(l_a,alb_p,aa_sp,prad,sp,floor=0.01):
+    t_d = planet_temp(l_a,alb_p,prad)
+    t_loc = local_temp(l_a,alb_p,t_d,sp['alb'])
+    return t_d, np.where(aa_sp > floor,t_loc,t_d).astype('f')
+
+
+def nspec_step(ss,l_a,sp,perc_ghg=1E-5,dt=1,floor=0.01):
+    """ One time step of the state `ss` ('a' fractions, 'x' bare
+    ground, 't_loc', 'prad') at luminosity l_a """
+    avail = ss['x'] if sp['comp'] is None else ss['x'] - sp['comp'] @ ss['a']
+    aa_sp = ss['a'] + (ss['a']*growth(ss['t_loc'],sp)*avail - ss['a']*sp['gam'])*dt
+    aa_sp = np.maximum(aa_sp,np.float32(floor))
+    xx = 1. - np.sum(aa_sp)
+    alb_p = xx*sp['bs_a'] + aa_sp @ sp['alb']
+    prad = np.minimum(1000,ss['prad']*(1.+(perc_ghg*np.sum(aa_sp))))
+    t_d, t_loc = temperatures(l_a,alb_p,aa_sp,prad,sp,floor)
+    return {'a':aa_sp,'x':xx,'alb':alb_p,'prad':prad,'t_d':t_d,'t_loc':t_loc}
+
+
+def run_nspec(sp,ns=5000,dl=2*1E-04,l_o=1400.,prad0=850.,perc_ghg=1E-5,dt=1,
+              floor=0.01,a0=0.01,every=1):
+    """ Luminosity ramp of daisyworld.py for the species `sp` (see
+    species_params). Returns the histories, every `every` steps, of
+    'a' (nsave,N), 'x', 'alb', 't_d', 'prad' and 'l_a'. """
+    nsp = sp['alb'].size
+    l_a = (0.2+np.arange(ns)*dl)*l_o
+    aa_sp = np.full(nsp,a0,dtype='f')
+    alb_p = np.float32(sp['bs_a'])
+    t_r = np.float32(((l_a[0]*(1-alb_p)/sigma)**0.25)-273.)
+    t_d = np.float32(((t_r+273)*np.float32((1000./prad0)**rcp))-273.)
+    ss = {'a':aa_sp,'x':np.float32(1.-np.sum(aa_sp)),'alb':alb_p,
+          'prad':np.float32(prad0),'t_d':t_d,'t_loc':np.full(nsp,t_d,dtype='f')}
+    steps = np.arange(0,ns,every)
+    out = {'a':np.empty((len(steps),nsp),dtype='f'),'l_a':l_a[steps]}
+    for kk in ['x','alb','t_d','prad']:
+        out[kk] = np.empty(len(steps),dtype='f')
+    for it in range(ns):
+        if it > 0:
+            ss = nspec_step(ss,l_a[it],sp,perc_ghg,dt,floor)
+        if it % every == 0:
+            for kk in ['a','x','alb','t_d','prad']:
+                out[kk][it//every] = ss[kk]
+    return out
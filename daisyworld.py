@@ -1,6 +1,10 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
+from daisy_ens import daisy_params, run_ens, hysteresis, populations
+from daisy_nspec import species_params, run_nspec
+from daisy_lat import run_lat
+from fig_batch import render_all
 
 population = 'mix'
 #population = 'neutral'
@@ -15,6 +19,15 @@ ns = 5000 # number steps
 rcp = 0.278 # R/cp
 prad0 = 850. # from >0 to 1000
 perc_ghg = 1E-5 # prad increase due to daisies
+make_sweep = False # ensemble over prad0, all members in one run
+make_hyst = False # equilibria for increasing and decreasing luminosity
+make_nspec = False # many species with competition for the bare ground
+make_lat = False # latitude bands with diffusive heat exchange
+make_batch = False # all populations and prad0 values, rendered to files
+batch_path = './daisy_figs/'
+
+if make_batch is True:
+    plt.switch_backend('Agg') # no windows: figures are rendered to files
 
 # Define array of solar constants
 l_a = (0.2+np.arange(ns)*dl)*l_o
@@ -41,81 +54,18 @@ if population == 'white':
     bs_a = 0.50
 
 
-# Variables
-t_bd = np.zeros(ns,dtype='f') # black daisies temp
-t_wd = np.zeros(ns,dtype='f') # white daisies temp
-bd   = np.zeros(ns,dtype='f') # black daisies fraction
-wd   = np.zeros(ns,dtype='f') # white daisies fraction
-xx   = np.zeros(ns,dtype='f') # bare ground fraction
-aa   = np.zeros(ns,dtype='f') # Daisyworld albedo
-t_r  = np.zeros(ns,dtype='f') # Radiation temp
-t_d  = np.zeros(ns,dtype='f') # Daisyworld temp
-bdg  = np.zeros(ns,dtype='f') # black daisies growth
-wdg  = np.zeros(ns,dtype='f') # white daisies growth
-prad = np.zeros(ns,dtype='f') # pressure radiation
-
-
-# Set initial conditions
-bd[0]   = 0.01 
-wd[0]   = 0.01 
-xx[0]   = 1.-bd[0]-wd[0]
-aa[0]   = bs_a
-t_r[0]  = ((l_a[0]*(1-aa[0])/sigma)**0.25)-273.
-t_d[0]  = ((t_r[0]+273)*((1000./prad0)**rcp))-273.
-t_bd[0] = t_d[0] 
-t_wd[0] = t_d[0]
-prad[0] = prad0
-
-# Loop over time
-it = 1
-while it < ns:
-    qq = 0.2 * l_a[it] / sigma
-    gam = 0.3
-
-    # Let the two population evolve. 
-    # ??b = growth function, ??g = growth rate, ??d = death rate
-    # Cap the fractions to avoid extinction
-
-    # Black daisies
-    bd_b = 0.
-    if np.logical_and(t_bd[it-1] > 5,t_bd[it-1] < 40):
-        bd_b = 1 - 0.003265*((22.5-t_bd[it-1])**2)
-    bdg[it] = bd[it-1]*bd_b*xx[it-1]
-    bdd = bd[it-1]*gam
-    bd[it] = bd[it-1] + (bdg[it]-bdd)*dt
-    if bd[it] < 0.01: bd[it] = 0.01
-
-
-    # White daisies
-    wd_b = 0.
-    if np.logical_and(t_wd[it-1] > 5, t_wd[it-1] < 40):
-        wd_b = 1 - 0.003265*((22.5-t_wd[it-1])**2)
-    wdg[it]  = wd[it-1]*wd_b*xx[it-1]
-    wdd = wd[it-1]*gam
-    wd[it] = wd[it-1] + (wdg[it]-wdd)*dt
-    if wd[it] < 0.01: wd[it] = 0.01
-
-    # Bare soil and planetary albedo calculation
-    xx[it] = 1. - bd[it] - wd[it]
-    aa[it] = (xx[it]*bs_a) + (bd_a*bd[it]) + (wd_a*wd[it])
-    
-    # Effect of daisies GHG removal (with capping)
-    prad[it] =  min(1000,prad[it-1]*(1.+(perc_ghg*(bd[it]+wd[it])))) # is it meaningful?
-
-    # Equilibrium (with greenhouse effect)
-    t_r[it] = ((l_a[it]*(1-aa[it])/sigma)**0.25) - 273.
-    t_d[it]  = ((t_r[it]+273)*((1000./prad[it])**rcp))-273.
-    t_wd[it] = t_d[it]
-    t_bd[it] = t_d[it]
-
-    if wd[it] > 0.01:
-        t_wd[it] = ((qq*(aa[it]-wd_a)+(t_d[it]+273.)**4.)**0.25) - 273.
-
-    if bd[it] > 0.01:
-        t_bd[it] = ((qq*(aa[it]-bd_a)+(t_d[it]+273.)**4.)**0.25) - 273. 
-
-    # Increment loop counter
-    it += 1
+# Integrate the luminosity ramp (a one-member ensemble, see daisy_ens.py
+# for sweeps over the parameters)
+pars = daisy_params(bd_a=bd_a,wd_a=wd_a,bs_a=bs_a,prad0=prad0,
+                    perc_ghg=perc_ghg,dl=dl,l_o=l_o)
+daisy = run_ens(pars,ns=ns,dt=dt,save=('bd','wd','xx','aa','t_d','prad'),
+                every=1)
+bd   = daisy['bd'][:,0] # black daisies fraction
+wd   = daisy['wd'][:,0] # white daisies fraction
+xx   = daisy['xx'][:,0] # bare ground fraction
+aa   = daisy['aa'][:,0] # Daisyworld albedo
+t_d  = daisy['t_d'][:,0] # Daisyworld temp
+prad = daisy['prad'][:,0] # pressure radiation
 
 f_out = sigma*(t_d+273.)**4.
 f_in = l_a*(1-aa) 
@@ -150,7 +100,101 @@ plt.xlabel('stellar luminosity (W/m2)')
 plt.legend()
 
 
+if make_sweep is True:
+    # Temperature over the ramp, for 200 values of prad0
+    prad0_ens = np.linspace(500,1000,200)
+    pars_ens = daisy_params(bd_a=bd_a,wd_a=wd_a,bs_a=bs_a,prad0=prad0_ens,
+                            perc_ghg=perc_ghg,dl=dl,l_o=l_o)
+    sweep = run_ens(pars_ens,ns=ns,dt=dt,save=('t_d',),every=10)
+    plt.figure()
+    plt.contourf(sweep['l_a'][:,0],prad0_ens,sweep['t_d'].T,
+                 levels=np.linspace(-40,80,13),cmap='bwr',extend='both')
+    plt.colorbar(label='Temperature (degC)')
+    plt.xlabel('stellar luminosity (W/m2)')
+    plt.ylabel('prad0 (mbar)')
+    plt.title(population)
+
+
+if make_hyst is True:
+    # Steady states along upward and downward sweeps (prad held fixed),
+    # each starting from the previous equilibrium
+    pars_eq = daisy_params(bd_a=bd_a,wd_a=wd_a,bs_a=bs_a,prad0=prad0)
+    hyst = hysteresis(pars_eq,np.linspace(0.2,1.2,201)*l_o)
+    plt.figure(figsize=(7,5))
+    plt.subplot(2,1,1)
+    for branch, lst in [('up','-'),('down','--')]:
+        plt.plot(hyst['l_a'],hyst[branch]['bd'][:,0],'k'+lst,label='black '+branch)
+        plt.plot(hyst['l_a'],hyst[branch]['wd'][:,0],'y'+lst,label='white '+branch)
+    plt.ylabel('Area fraction (0-1)')
+    plt.title(population + ' equilibria, prad= '+str(int(prad0)))
+    plt.legend()
+    plt.subplot(2,1,2)
+    for branch, lst in [('up','-'),('down','--')]:
+        plt.plot(hyst['l_a'],hyst[branch]['t_d'][:,0],'k'+lst,label=branch)
+    plt.ylabel('Temperature (degC)')
+    plt.xlabel('stellar luminosity (W/m2)')
+    plt.legend()
+
+if make_nspec is True:
+    # 50 species from dark to bright, competing for the bare ground
+    nsp = 50
+    alb_sp = np.linspace(0.10,0.90,nsp)
+    spec = species_params(alb_sp,bs_a=bs_a,comp=0.2*(1-np.eye(nsp)))
+    res_sp = run_nspec(spec,ns=ns,prad0=prad0,dl=dl,l_o=l_o,every=10)
+    plt.figure(figsize=(7,5))
+    plt.subplot(2,1,1)
+    plt.pcolormesh(res_sp['l_a'],alb_sp,res_sp['a'].T,cmap='YlGn',shading='auto')
+    plt.colorbar(label='Area fraction (0-1)')
+    plt.ylabel('Daisy albedo')
+    plt.title(str(nsp)+' species, prad= '+str(int(prad0)))
+    plt.subplot(2,1,2)
+    plt.plot(res_sp['l_a'],res_sp['t_d'],'k')
+    plt.ylabel('Temperature (degC)')
+    plt.xlabel('stellar luminosity (W/m2)')
+
+if make_lat is True:
+    # Daisies and temperature of 90 latitude bands along the ramp
+    pars_lat = daisy_params(bd_a=bd_a,wd_a=wd_a,bs_a=bs_a,prad0=prad0,dl=dl,l_o=l_o)
+    res_lat = run_lat(pars_lat,nlat=90,ns=ns,kappa=0.05,every=10)
+    plt.figure(figsize=(7,7))
+    for ip, (kk, cmap, lab) in enumerate([('bd','Greys','Black daisies (0-1)'),
+                                          ('wd','YlOrBr','White daisies (0-1)'),
+                                          ('t_d','RdBu_r','Temperature (degC)')]):
+        plt.subplot(3,1,ip+1)
+        plt.pcolormesh(res_lat['l_a'][:,0],res_lat['lat'],res_lat[kk][:,:,0].T,
+                       cmap=cmap,shading='auto')
+        plt.colorbar(label=lab)
+        plt.ylabel('Latitude')
+    plt.xlabel('stellar luminosity (W/m2)')
+
+
+if make_batch is True:
+    # Ramps of all the populations for a range of prad0, as a single
+    # ensemble, then one spec per member for fractions and temperature
+    pops = list(populations)
+    prad_b = np.linspace(500,1000,11)
+    alb_b = np.array([populations[pop] for pop in pops])
+    pars_b = daisy_params(bd_a=alb_b[:,0,None],wd_a=alb_b[:,1,None],bs_a=alb_b[:,2,None],
+                          prad0=prad_b[None,:],perc_ghg=perc_ghg,dl=dl,l_o=l_o)
+    res_b = run_ens(pars_b,ns=ns,dt=dt,save=('bd','wd','xx','t_d'),every=10)
+    l_b = res_b['l_a'][:,0]
+    specs = []
+    for im in range(len(pars_b['gam'])):
+        pop, prad_m = pops[im//len(prad_b)], prad_b[im % len(prad_b)]
+        tag = '%s_p%04i' % (pop,prad_m)
+        title = pop + ' prad0= '+str(int(prad_m))
+        specs.append({'fname':'daisy_'+tag+'_frac', 'legend':True, 'title':title,
+                      'lines':[(l_b,res_b['xx'][:,im],'-','bare',{'color':'gray'}),
+                               (l_b,res_b['bd'][:,im],'-','black',{'color':'black'}),
+                               (l_b,res_b['wd'][:,im],'-','white',{'color':'yellow'})],
+                      'xlabel':'stellar luminosity (W/m2)','ylabel':'Area fraction (0-1)'})
+        t_bare = (l_b*(1-pars_b['bs_a'][im])/sigma)**0.25-273.
+        specs.append({'fname':'daisy_'+tag+'_temp', 'legend':True, 'title':title,
+                      'lines':[(l_b,res_b['t_d'][:,im],'k-','actual'),
+                               (l_b,t_bare,'k:','bare (no atmo)')],
+                      'xlabel':'stellar luminosity (W/m2)','ylabel':'Temperature (degC)'})
+    render_all(specs,batch_path)
 
-plt.show()
 
 
+plt.show()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Eddy flux decomposition for a list of (velocity, tracer) pairs, e.g.
+[('v','t'), ('v','q'), ('v','u'), ('w','theta')].
+
+All pairs are accumulated in the same pass over the data (see
+clim_stat.py): each velocity chunk is multiplied by the stack of its
+tracers at once, and the time/zonal mean deviations of a velocity are
+computed once and shared by all its tracers.
+"""
+
+import numpy as np
+from clim_stat import stream_stat
+
+
+# Name, units and contour maxima (transient, stationary, mean) of
+# the meridional fluxes, by tracer. Add new tracers here.
+flux_info = {
+    't'     : ('Sensible heat','K m/s',(10,5,500)),
+    'theta' : ('Potential temperature','K m/s',(10,5,500)),
+    'q'     : ('Moisture','kg/kg m/s',(0.01,0.005,0.02)),
+    'u'     : ('Momentum','m2/s2',(50,20,50)),
+    'z'     : ('Geopotential','m3/s3',(2E+4,1E+4,2E+6)),
+}
+
+
+# Fields needed by a list of pairs (velocities first, no repetitions)
+def pair_names(pairs):
+    names = []
+    for pp in pairs:
+        for name in pp:
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def flux_terms(stats,pairs):
+    """ From the result of StatAccum, return {pair: {'tran','stat',
+    'mean','total'}}, each a (lev,lat) zonal mean flux """
+    flux = {}
+    for pp in pairs:
+        pp = tuple(pp)
+        flux[pp] = {'tran':stats['tran'][pp],
+                    'stat':stats['stat'][pp],
+                    'mean':stats['mean'][pp]}
+        flux[pp]['total'] = flux[pp]['tran']+flux[pp]['stat']+flux[pp]['mean']
+    return flux
+
+
+def eddy_flux(sources,pairs,derive=None,nchunk=1,ncycle=None):
+    """ Transient, stationary and mean circulation fluxes of all
+    `pairs`, in one pass over `sources` (see stream_stat) """
+    acc = stream_stat(sources,pairs,derive,nchunk,ncycle,pair_names(pairs))
+    return flux_terms(acc.result(),pairs)
+
+
+# Name and units of the flux of a pair (vertical fluxes in Pa/s)
+def flux_label(pair):
+    name, units = flux_info.get(pair[1],(pair[1],pair[1]+' m/s'))[:2]
+    if pair[0] == 'w':
+        name, units = 'Vertical '+name.lower(), units.replace('m/s','Pa/s')
+    return name, units
+
+
+# Symmetric contour levels for a flux term ('tran','stat','mean');
+# maximum from flux_info for the meridional fluxes, otherwise from
+# the data
+def flux_levels(pair,term,field=None,nlev=11):
+    info = flux_info.get(pair[1])
+    if info is not None and pair[0] == 'v':
+        fmax = info[2][['tran','stat','mean'].index(term)]
+    else:
+        fmax = np.nanmax(np.abs(field))
+        if not fmax > 0:
+            fmax = 1.
+    return np.linspace(-fmax,fmax,nlev)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Multi-month ERBE ingestion: a directory of monthly ERBE text files
+(ERBE_MM_YYYY.txt) -> one float32 (time,lat,lon) cube per variable.
+
+The files are parsed (erbe_io.read_erbe) and regridded
+(erbe_grid.regrid) by a pool of worker processes, one file per task,
+and the cubes are saved to a single .npz file together with the grid
+and the dates (yyyymm). Later runs load the .npz file, unless a text
+file is newer or the variables differ, so seasonal cycles can be
+built without parsing the text files again.
+"""
+
+import os
+import re
+import glob
+import numpy as np
+from erbe_io import read_erbe
+from erbe_grid import regrid
+from proc_pool import pool_map
+
+
+# Regular 2.5 deg grid of rad_sat.py
+lon_erbe = np.linspace(0,357.5,int(360/2.5))
+lat_erbe = np.linspace(-90,90,int(180/2.5)+1)
+
+_fname = re.compile(r'ERBE_(\d\d)_(\d\d\d\d)\.txt$')
+
+
+def erbe_files(data_path):
+    """ Monthly files of a directory and their dates (yyyymm), in
+    time order """
+    files = {}
+    for path in glob.glob(os.path.join(data_path,'ERBE_*_*.txt')):
+        match = _fname.search(os.path.basename(path))
+        if match:
+            files[int(match.group(2))*100+int(match.group(1))] = path
+    dates = sorted(files)
+    return [files[dd] for dd in dates], np.array(dates)
+
+
+# Parse and regrid one file: {name: (lat,lon)}
+def read_month(args):
+    path, names, lat_rg, lon_rg = args
+    rec = read_erbe(path,cols=('lat','lon')+tuple(names))
+    return {kk:vv.T for kk, vv in regrid(rec,names,lat_rg,lon_rg).items()}
+
+
+def build_cube(paths,names,lat_rg=lat_erbe,lon_rg=lon_erbe,nproc=None):
+    """ Dict of float32 (time,lat,lon) cubes of the fields `names`
+    (see erbe_io.erbe_cols) of the files `paths` """
+    args = [(pp,tuple(names),lat_rg,lon_rg) for pp in paths]
+    months = pool_map(read_month,args,nproc)
+    cube = {}
+    for name in names:
+        cube[name] = np.empty((len(paths),len(lat_rg),len(lon_rg)),dtype='f')
+        for it, month in enumerate(months):
+            cube[name][it] = month[name]
+    return cube
+
+
+def load_cube(data_path,names=('sw','lw','net','alb'),cube_file=None,
+              nproc=None):
+    """ Dict of the (time,lat,lon) cubes of all the monthly files in
+    `data_path`, plus 'date', 'lat' and 'lon'. The cubes are read
+    from `cube_file` (default: data_path/erbe_cube.npz) when it is up
+    to date, otherwise built and saved there. """
+    if cube_file is None:
+        cube_file = os.path.join(data_path,'erbe_cube.npz')
+    paths, dates = erbe_files(data_path)
+    if len(paths) == 0:
+        raise ValueError('No ERBE_MM_YYYY.txt files in '+data_path)
+    if os.path.exists(cube_file) and \
+       os.path.getmtime(cube_file) >= max(os.path.getmtime(pp) for pp in paths):
+        with np.load(cube_file) as npz:
+            if all(nn in npz for nn in names) and \
+               np.array_equal(npz['date'],dates):
+                return {kk:npz[kk] for kk in list(names)+['date','lat','lon']}
+    cube = build_cube(paths,names,nproc=nproc)
+    cube.update(date=dates,lat=lat_erbe,lon=lon_erbe)
+    tmp = cube_file+'.tmp.npz' # never leave a partial file
+    np.savez(tmp,**cube)
+    os.replace(tmp,cube_file)
+    return cube
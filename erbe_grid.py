@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""
+Regridding of scattered (lat,lon) records, e.g. the ERBE files, onto
+a regular grid.
+
+Each record goes to the nearest grid point (ties to the lower index,
+as np.abs(grid-x).argmin()), found with searchsorted on the sorted
+grid axes instead of a search over the grid for every record. The
+index map is cached per grid and per set of record coordinates, so
+that months sharing the same records reuse it, and all the variables
+are scattered at once with fancy indexing.
+"""
+
+import hashlib
+import numpy as np
+
+
+# Index maps, by grid and record coordinates
+_index_cache = {}
+
+
+# Nearest point of the increasing axis `grid` to each value of xx
+def nearest_index(grid,xx):
+    grid = np.asarray(grid,dtype='f8')
+    xx = np.asarray(xx,dtype='f8')
+    ind = np.clip(np.searchsorted(grid,xx,side='left'),1,len(grid)-1)
+    lower = (xx-grid[ind-1]) <= (grid[ind]-xx)
+    return np.where(lower,ind-1,ind)
+
+
+def _key(*arrays):
+    sha = hashlib.sha1()
+    for arr in arrays:
+        arr = np.ascontiguousarray(arr)
+        sha.update(str((arr.dtype,arr.shape)).encode())
+        sha.update(arr.tobytes())
+    return sha.hexdigest()
+
+
+def grid_index(lat,lon,lat_rg,lon_rg):
+    """ (lon_ind,lat_ind) of the grid points of the records, cached """
+    key = _key(lat,lon,lat_rg,lon_rg)
+    if key not in _index_cache:
+        ind = (nearest_index(lon_rg,lon),nearest_index(lat_rg,lat))
+        for ii in ind:
+            ii.setflags(write=False)
+        _index_cache[key] = ind
+    return _index_cache[key]
+
+
+def regrid(rec,names,lat_rg,lon_rg,fill=np.nan):
+    """ Dict of (lon,lat) float32 arrays of the fields `names` of the
+    records `rec` (structured array or dict with 'lat' and 'lon'),
+    `fill` where there are no records """
+    lon_ind, lat_ind = grid_index(rec['lat'],rec['lon'],lat_rg,lon_rg)
+    out = np.full((len(names),len(lon_rg),len(lat_rg)),fill,dtype='f')
+    out[:,lon_ind,lat_ind] = np.stack([rec[name] for name in names])
+    return dict(zip(names,out))
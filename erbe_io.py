@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Reader of the ERBE monthly text files (e.g. ERBE_01_1987.txt).
+
+After a 19 line header, each record is a fixed-width line of 13
+columns (lat, lon, then the fluxes below), where a negative value
+can be glued to the previous one (e.g. '245.32-12.45'). The whole
+file is tokenized at once: a space is inserted before every minus
+sign (values are fixed-point, so a minus is always a sign), and all
+the numbers are converted to float32 in a single call, then reshaped
+to (records, columns).
+Missing values (999.99) become nan. Only the requested columns are
+returned, as a structured array (rec['sw'], rec['alb'], ...).
+"""
+
+import numpy as np
+
+
+# Columns of the ERBE files
+erbe_cols = ['lat',    # latitude (deg)
+             'lon',    # longitude (deg)
+             'sw',     # reflected shortwave (W/m2)
+             'lw',     # outgoing longwave (W/m2)
+             'net',    # net radiation (W/m2)
+             'alb',    # albedo (%)
+             'cs_sw',  # clear-sky reflected shortwave
+             'cs_lw',  # clear-sky outgoing longwave
+             'cs_net', # clear-sky net radiation
+             'cs_alb', # clear-sky albedo
+             'lwcf',   # longwave cloud forcing
+             'swcf',   # shortwave cloud forcing
+             'netcf']  # net cloud forcing
+erbe_missing = 999.99
+
+
+def read_erbe(path,cols=('lat','lon','sw','lw','alb'),skip_header=19,
+              missing=erbe_missing):
+    """ Structured float32 array of the columns `cols` of an ERBE
+    file (all of erbe_cols if cols is None), one entry per record """
+    with open(path,'rb') as ff:
+        text = ff.read()
+    body = text.split(b'\n',skip_header)[-1]
+    tokens = body.replace(b'-',b' -').split()
+    table = np.array(tokens,dtype='f')
+    ncol = len(erbe_cols)
+    if table.size % ncol != 0:
+        raise ValueError('%s: %i values, not a multiple of %i columns'
+                         % (path,table.size,ncol))
+    table = table.reshape(-1,ncol)
+    names = list(erbe_cols) if cols is None else list(cols)
+    rec = np.empty(len(table),dtype=[(name,'f') for name in names])
+    for name in names:
+        col = table[:,erbe_cols.index(name)]
+        if name not in ('lat','lon'):
+            col = np.where(col == np.float32(missing),np.float32(np.nan),col)
+        rec[name] = col
+    return rec
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Headless, parallel rendering of figures described as plain specs.
+
+A spec is a dict with the data slice and the plot options, e.g.
+
+    {'fname':'ta_m08_l22', 'x':lon, 'y':lat, 'z':ta[7,22],
+     'levels':220+np.arange(11)*10, 'cmap':'bwr', 'extend':'both',
+     'colorbar':'horizontal', 'title':'Temperature month= 8'}
+
+Keys (all optional except 'fname' and the data):
+ - 'z' (2D, contourf of z over x,y) and/or 'lines', a list of
+   (x, y, fmt, label) line plots, optionally with a dict of plot
+   keywords as fifth item (e.g. {'color':(1,0,0,1)})
+ - 'hlines': list of (y, color) horizontal lines
+ - 'contour': 2D field drawn as black contours, 'clevels' its levels
+ - 'hatch': 2D boolean field, hatched where True
+ - 2D fields can also be given as a netCDF slab reference,
+   {'path':file, 'var':name, 'index':(imon,jlev)}, which is then
+   read by the worker itself (less data sent through the pool), or
+   as a callable returning the field, e.g. a functools.partial of a
+   function of the calling script: the forked workers then slice the
+   data they inherited, and only the indices are sent
+ - 'levels', 'cmap', 'extend', 'colorbar' (None, 'vertical' or
+   'horizontal'), 'title', 'xlabel', 'ylabel', 'xlim', 'ylim',
+   'xscale', 'yscale', 'figsize', 'legend'
+Figures are drawn with the object oriented interface on the Agg
+canvas, so no GUI backend is ever involved, and the specs are
+split over a pool of worker processes.
+"""
+
+import os
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from proc_pool import pool_map
+
+
+# Data of a spec entry: an array, a netCDF slab reference or a callable
+def get_data(zz):
+    if callable(zz):
+        zz = zz()
+    if isinstance(zz,dict):
+        from nc_lazy import open_nc
+        zz = open_nc(zz['path']).variables[zz['var']][tuple(zz['index'])]
+    if np.ma.isMaskedArray(zz):
+        zz = zz.astype('f').filled(np.nan)
+    return np.asarray(zz)
+
+
+def render_spec(spec,out_path='./',fmt='png',dpi=100):
+    """ Draw one spec and save it to out_path/fname.fmt """
+    fig = Figure(figsize=spec.get('figsize',(6.4,4.8)))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1,1,1)
+    if spec.get('z') is not None:
+        cnt = ax.contourf(spec['x'],spec['y'],get_data(spec['z']),
+                          levels=spec.get('levels'),cmap=spec.get('cmap'),
+                          extend=spec.get('extend','neither'))
+        if spec.get('colorbar') is not None:
+            fig.colorbar(cnt,ax=ax,orientation=spec['colorbar'])
+    if spec.get('contour') is not None:
+        cnt = ax.contour(spec['x'],spec['y'],get_data(spec['contour']),
+                         levels=spec.get('clevels'),colors='k')
+        ax.clabel(cnt,fmt='%1.0i')
+    if spec.get('hatch') is not None:
+        ax.contourf(spec['x'],spec['y'],get_data(spec['hatch']).astype('f'),
+                    levels=[.5,1.5],hatches=['..'],colors='none')
+    for line in spec.get('lines',[]):
+        xx, yy, lfmt, label = line[:4]
+        ax.plot(xx,yy,lfmt,label=label,**(line[4] if len(line) > 4 else {}))
+    for yy, color in spec.get('hlines',[]):
+        ax.axhline(yy,color=color)
+    if spec.get('xscale') is not None:
+        ax.set_xscale(spec['xscale'])
+    if spec.get('yscale') is not None:
+        ax.set_yscale(spec['yscale'])
+    if spec.get('xlim') is not None:
+        ax.set_xlim(spec['xlim'])
+    if spec.get('ylim') is not None:
+        ax.set_ylim(spec['ylim'])
+    ax.set_xlabel(spec.get('xlabel',''))
+    ax.set_ylabel(spec.get('ylabel',''))
+    ax.set_title(spec.get('title',''))
+    if spec.get('legend'):
+        ax.legend()
+    fname = os.path.join(out_path,spec['fname']+'.'+fmt)
+    fig.savefig(fname,format=fmt,dpi=dpi)
+    return fname
+
+
+# Pool workers take a single argument
+def _render(args):
+    return render_spec(*args)
+
+
+def render_all(specs,out_path='./figs/',fmt='png',dpi=100,nproc=None):
+    """ Render all specs to files in out_path, using `nproc` worker
+    processes (default: all cores; 1 = serial). Returns the file
+    names, in the order of the specs. """
+    os.makedirs(out_path,exist_ok=True)
+    args = [(spec,out_path,fmt,dpi) for spec in specs]
+    return pool_map(_render,args,nproc)
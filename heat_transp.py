@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+"""
+Implied poleward energy transport from the net radiation at the top
+of the atmosphere (e.g. the ERBE zonal NET files).
+
+The transport across the northern edge of each latitude band is the
+integral, from the South Pole, of the net radiation times the band
+area, after removing the global mean net radiation (otherwise the
+imbalance accumulates into a spurious transport at the North Pole):
+  T(lat) = sum_{lat' <= lat} (net - <net>) A(lat')
+All columns (months, annual mean) are done by one cumulative sum.
+"""
+
+import numpy as np
+from wgt_mean import wgt_mean
+
+
+def implied_transport(net,lat_wgt,lat,dlat=2.5):
+    """ Northward transport (PW) for net radiation `net` (lat,...)
+    in W/m2 and band areas `lat_wgt` (m2, see wgt_mean.area_weights).
+    Returns the northern band edges (increasing) and the transport
+    there (lat,...). Missing values count as no imbalance. """
+    order = np.argsort(lat)
+    net = np.asarray(net,dtype='f8')[order]
+    wgt = np.asarray(lat_wgt,dtype='f8')[order]
+    wshape = (-1,)+(1,)*(net.ndim-1)
+    # Global mean of each column, removed before integrating
+    imb = wgt_mean(net,wgt,axis=0)
+    flux = np.nan_to_num((net-imb)*wgt.reshape(wshape))
+    lat_edge = np.asarray(lat,dtype='f8')[order]+dlat/2.
+    return lat_edge, np.cumsum(flux,axis=0)*1E-15
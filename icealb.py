@@ -4,6 +4,7 @@ import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import sys
+from fig_batch import render_all
 
 """ 
 Based on Pierrehumbert's script for ice-albedo
@@ -36,6 +37,11 @@ temp_i = 260. # ice temperature
 temp_o = 290. # water temperature
 olr_a = 113. #
 olr_b = 2.177
+make_batch = False # Render the panels to files (headless)
+batch_path = './icealb_figs/'
+
+if make_batch is True:
+    plt.switch_backend('Agg') # no windows: figures are rendered to files
 
 # Array definition
 temp = 150. + np.arange(tlen)
@@ -114,6 +120,33 @@ else:
     plt.text(0.3,0.5,'No prad dependence')
 
 plt.tight_layout()
+
+if make_batch is True:
+
+    # One spec per panel
+    tag = 'L%04i' % l_o
+    flux_lines = [(temp,flux_in,'k','in')]
+    for ipress in range(plen):
+        if blackbody is True:
+            flux_rad = sigma*(temp/(1000./prad[ipress])**rcp)**4
+        else:
+            flux_rad = olr_a + olr_b*(temp-220.)
+        flux_lines.append((temp,flux_rad,'--',None if ipress else 'out',{'color':'red'}))
+    specs = [{'fname':'icealb_alpha','lines':[(temp,alpha,'-',None)],
+              'xlabel':'Surface temperature (K)','ylabel':'alpha (adim)'},
+             {'fname':'icealb_flux_'+tag,'lines':flux_lines,'ylim':[50,350],
+              'xlabel':'Surface temperature (K)','ylabel':'Flux (W/m2)',
+              'title':'L = '+str(l_o),'legend':True}]
+    if blackbody is True:
+        specs.append({'fname':'icealb_eq_'+tag,
+                      'lines':[(np.full(len(eq_pts),prad[ipress]),temp[eq_pts[:,ipress]],'*',None,
+                                {'color':colors[ipress]}) for ipress in range(plen)],
+                      'hlines':[(temp_i,'b'),(temp_o,'r')],
+                      'xlim':[max(prad),min(prad)],'ylim':[200,350],
+                      'xlabel':'Prad (mbar)','ylabel':'Eq temp (K)',
+                      'title':'L = '+str(l_o)})
+    render_all(specs,batch_path)
+
 plt.show()
 #plt.savefig('CHANGEME.png',format='png') # save png, change name as needed
 
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""
+Lazy access to netCDF files.
+
+Variables are read only when indexed, e.g. `ds['t'][7,22]` reads a
+single month and level. Open handles are shared between datasets
+pointing to the same file, and recently decoded slabs are kept in a
+small LRU cache (bounded in bytes), so that going back and forth
+between a few levels does not hit the file again.
+"""
+
+from collections import OrderedDict
+import numpy as np
+import netCDF4 as nc4
+
+
+# Open handles, shared by path
+_handles = {}
+
+def open_nc(path):
+    ncf = _handles.get(path)
+    if ncf is None or not ncf.isopen():
+        ncf = nc4.Dataset(path,'r')
+        ncf.set_always_mask(False) # plain arrays if nothing is missing
+        _handles[path] = ncf
+    return ncf
+
+
+def close_all():
+    for ncf in _handles.values():
+        if ncf.isopen():
+            ncf.close()
+    _handles.clear()
+
+
+# Index tuple with the Ellipsis expanded and the None (new axes) left
+# out, and the index giving back the new axes after the read
+def _split_key(key,ndim):
+    if not isinstance(key,tuple):
+        key = (key,)
+    nreal = sum(1 for kk in key if kk is not None and kk is not Ellipsis)
+    full = []
+    for kk in key:
+        if kk is Ellipsis:
+            full.extend([slice(None)]*(ndim-nreal))
+        else:
+            full.append(kk)
+    post = tuple(np.newaxis if kk is None else slice(None)
+                 for kk in full if kk is None or np.ndim(kk) > 0 or isinstance(kk,slice))
+    return tuple(kk for kk in full if kk is not None), post
+
+
+# Hashable version of an index tuple (ints, slices and arrays)
+def _index_key(key,ndim):
+    if not isinstance(key,tuple):
+        key = (key,)
+    if len(key) < ndim:
+        key = key + (slice(None),)*(ndim-len(key))
+    out = []
+    for kk in key:
+        if isinstance(kk,slice):
+            out.append(('s',kk.start,kk.stop,kk.step))
+        elif np.ndim(kk) == 0:
+            out.append(('i',int(kk)))
+        else:
+            out.append(('a',tuple(np.asarray(kk).ravel().tolist())))
+    return tuple(out)
+
+
+def _index_val(kk):
+    if kk[0] == 's':
+        return slice(kk[1],kk[2],kk[3])
+    if kk[0] == 'i':
+        return kk[1]
+    return np.array(kk[1])
+
+
+# Index slice of coordinate values between c1 and c2 (both included),
+# for ascending or descending coordinates
+def box_index(coord,c1,c2):
+    coord = np.asarray(coord)
+    ind = np.where(np.logical_and(coord >= min(c1,c2),coord <= max(c1,c2)))[0]
+    if len(ind) == 0:
+        raise ValueError('No coordinate values between %g and %g' % (c1,c2))
+    return slice(int(ind[0]),int(ind[-1])+1)
+
+
+# Index slices of longitudes between c1 and c2 (eastward, both
+# included), compared modulo 360: one slice, or two when the box
+# crosses the end of the grid, the western part (starting at c1) first
+def lon_index(coord,c1,c2):
+    coord = np.asarray(coord) % 360.
+    if c2-c1 >= 360.:
+        return [slice(0,len(coord))]
+    c1, c2 = c1 % 360., c2 % 360.
+    if c1 <= c2:
+        sel = np.logical_and(coord >= c1,coord <= c2)
+    else:
+        sel = np.logical_or(coord >= c1,coord <= c2)
+    ind = np.where(sel)[0]
+    if len(ind) == 0:
+        raise ValueError('No longitudes between %g and %g' % (c1,c2))
+    gaps = np.where(np.diff(ind) > 1)[0]
+    if len(gaps) == 0:
+        return [slice(int(ind[0]),int(ind[-1])+1)]
+    # Two runs, at the end and at the start of the grid
+    return [slice(int(ind[gaps[0]+1]),int(ind[-1])+1),
+            slice(int(ind[0]),int(ind[gaps[0]])+1)]
+
+
+class LazyVar:
+    """ A netCDF variable read on demand, slab by slab """
+
+    def __init__(self,ds,name):
+        self.ds = ds
+        self.name = name
+        var = ds.handle().variables[name]
+        self.shape = var.shape
+        self.ndim = len(var.shape)
+        self.dimensions = var.dimensions
+        self.dtype = var.dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self,key):
+        return self.ds.read(self.name,key)
+
+
+class LazyDataset:
+    """ Lazy view of a netCDF file. Coordinates are read at once
+    (they are small), variables only when indexed. `maxbytes` bounds
+    the memory used by the slab cache. """
+
+    def __init__(self,path,maxbytes=256*2**20):
+        self.path = path
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.cache = OrderedDict()
+        self.coords = {}
+
+    def handle(self):
+        return open_nc(self.path)
+
+    def __getitem__(self,name):
+        return LazyVar(self,name)
+
+    def __contains__(self,name):
+        return name in self.handle().variables
+
+    def coord(self,name):
+        if name not in self.coords:
+            self.coords[name] = self.handle().variables[name][:]
+        return self.coords[name]
+
+    def read(self,name,key=()):
+        """ Read var[key], going through the LRU cache """
+        var = self.handle().variables[name]
+        key, post = _split_key(key,var.ndim)
+        if np.newaxis in post:
+            return self.read(name,key)[post]
+        ckey = (name,_index_key(key,var.ndim))
+        if ckey in self.cache:
+            self.cache.move_to_end(ckey)
+            return self.cache[ckey]
+        data = var[tuple(_index_val(kk) for kk in ckey[1])]
+        if isinstance(data,np.ndarray):
+            data.setflags(write=False) # shared, do not modify in place
+        self.cache[ckey] = data
+        self.nbytes += data.nbytes
+        # Evict least recently used slabs (keep at least the last one)
+        while self.nbytes > self.maxbytes and len(self.cache) > 1:
+            old_key, old = self.cache.popitem(last=False)
+            self.nbytes -= old.nbytes
+        return data
+
+    def box(self,name,tim=None,lev=None,lat=None,lon=None):
+        """ Read a subset by role: `tim`/`lev` are indices or slices,
+        `lat` is a (min,max) and `lon` a (west,east) coordinate pair,
+        e.g. (350,10) for a box across 0 (read as two slabs). Dims are
+        assumed in the (time,[lev],lat,lon) order. """
+        var = self.handle().variables[name]
+        key = [slice(None)]*var.ndim
+        if tim is not None:
+            key[0] = tim
+        if lev is not None:
+            key[1] = lev
+        if lat is not None:
+            key[-2] = box_index(self.coord(var.dimensions[-2]),*lat)
+        if lon is None:
+            return self.read(name,tuple(key))
+        slabs = [self.read(name,tuple(key[:-1])+(ss,))
+                 for ss in lon_index(self.coord(var.dimensions[-1]),*lon)]
+        if len(slabs) == 1:
+            return slabs[0]
+        if any(np.ma.isMaskedArray(ss) for ss in slabs):
+            return np.ma.concatenate(slabs,axis=-1)
+        return np.concatenate(slabs,axis=-1)
+
+    def clear(self):
+        self.cache.clear()
+        self.nbytes = 0
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+Ocean basins and sectors, as lists of lon/lat boxes, and read-time
+subsetting of (time,lev,lat,lon) netCDF variables.
+
+A box is (lon1,lon2,lat1,lat2), with lon taken modulo 360: lon1 <= lon
+< lon2, or, if lon1 > lon2, a box crossing the 0 meridian (e.g. 290 ->
+20 for the Atlantic; (170,-170) is the 20 degrees across the
+dateline), lat1 <= lat <= lat2. The basins below are rough
+(Atlantic/Pacific split at the Americas, Indian/Pacific at 120E,
+Southern Ocean south of 35S); with the land mask of the data they
+are enough for zonal-mean transports.
+
+Only the smallest lat/lon window covering all the requested basins
+is read from file (as one or two longitude slabs, for windows across
+the edge of the grid), and all basins are then computed in one pass
+(see the `bmask` of clim_stat.StatAccum).
+"""
+
+import numpy as np
+
+
+# Named basins (lists of boxes)
+basins = {
+    'global':       [(0,360,-90,90)],
+    'atlantic':     [(290,20,-35,9),(276,20,9,17),(262,20,17,70)],
+    'indo_pacific': [(20,290,-35,9),(20,276,9,17),(20,262,17,66)],
+    'pacific':      [(120,290,-35,9),(120,276,9,17),(120,262,17,66)],
+    'indian':       [(20,120,-35,31)],
+    'southern':     [(0,360,-90,-35)],
+}
+
+
+# Boxes of a basin: a name, a single box or a list of boxes
+def basin_boxes(basin):
+    if isinstance(basin,str):
+        return basins[basin]
+    if np.ndim(basin) == 1:
+        return [tuple(basin)]
+    return [tuple(bb) for bb in basin]
+
+
+def basin_label(basin):
+    if isinstance(basin,str):
+        return basin.replace('_','-').capitalize()
+    lon1, lon2, lat1, lat2 = basin_boxes(basin)[0]
+    return 'Box %g-%gE %g-%gN' % (lon1,lon2,lat1,lat2)
+
+
+# Longitudes (in 0-360) of a box, with box limits in any convention,
+# e.g. (170,-170) across the dateline or (-60,0)
+def _in_lon(lon,lon1,lon2):
+    if lon2 - lon1 >= 360:
+        return np.ones(len(lon),dtype=bool)
+    lon1, lon2 = lon1 % 360., lon2 % 360.
+    if lon1 <= lon2:
+        return (lon >= lon1) & (lon < lon2)
+    return (lon >= lon1) | (lon < lon2) # across the 0 meridian
+
+
+def basin_masks(names,lat,lon):
+    """ (nb,lat,lon) boolean masks of the basins `names` """
+    lon = np.asarray(lon) % 360.
+    lat = np.asarray(lat)
+    masks = np.zeros((len(names),len(lat),len(lon)),dtype=bool)
+    for ib, name in enumerate(names):
+        for lon1, lon2, lat1, lat2 in basin_boxes(name):
+            in_lon = _in_lon(lon,lon1,lon2)
+            in_lat = (lat >= lat1) & (lat <= lat2)
+            masks[ib] |= in_lat[:,None] & in_lon[None,:]
+    return masks
+
+
+def read_index(names,lat,lon):
+    """ Index of the window covering the basins `names`: a lat slice
+    and one or two lon slices (two when the window crosses the edge
+    of the grid, the first one then being the western part) """
+    masks = basin_masks(names,lat,lon)
+    if not masks.any():
+        raise ValueError('The basins %s cover no grid points' % (list(names),))
+    rows = np.flatnonzero(masks.any(axis=(0,2)))
+    cols = masks.any(axis=(0,1))
+    lat_sl = slice(int(rows[0]),int(rows[-1])+1)
+    if cols.all():
+        return lat_sl, [slice(None)]
+    # Window = complement of the largest (circular) gap in lon,
+    # found on the columns rolled to start at a covered one
+    nlon = len(cols)
+    c0 = np.argmax(cols)
+    gap = np.diff(np.concatenate([[0],~np.roll(cols,-c0),[0]]).astype(int))
+    g0, g1 = np.flatnonzero(gap == 1), np.flatnonzero(gap == -1)
+    kk = np.argmax(g1-g0)
+    i0, i1 = int(g1[kk]+c0) % nlon, int(g0[kk]+c0) % nlon
+    if i0 < i1:
+        return lat_sl, [slice(i0,i1)]
+    if i1 == 0:
+        return lat_sl, [slice(i0,nlon)]
+    return lat_sl, [slice(i0,nlon),slice(0,i1)]
+
+
+def read_box(var,lat_sl,lon_sls):
+    """ Read the window of a (...,lat,lon) netCDF variable (or array),
+    joining the lon slabs """
+    slabs = [var[...,lat_sl,sl] for sl in lon_sls]
+    if len(slabs) == 1:
+        return slabs[0]
+    if any(np.ma.isMaskedArray(ss) for ss in slabs):
+        return np.ma.concatenate(slabs,axis=-1)
+    return np.concatenate(slabs,axis=-1)
+
+
+def read_lon(lon,lon_sls):
+    """ Longitudes of the window, increasing across the grid edge """
+    lon = np.asarray(lon)
+    parts = [lon[sl] for sl in lon_sls]
+    for kk in range(1,len(parts)):
+        parts[kk] = parts[kk] + 360.
+    return np.concatenate(parts)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Concurrent reader of gridded ocean files (e.g. the GODAS
+ucur/vcur/pottmp files, one variable per file).
+
+The variables are read concurrently, by a pool of worker processes
+each with its own netCDF handle (threads are not used: the netCDF-C
+and HDF5 libraries are not thread safe and crash when several files
+are read at the same time from threads). The result is an OceanData object,
+holding all the variables on the same (time,lev,lat,lon) grid: the
+shapes and coordinates of the files are checked against each other.
+An optional lat/lon window (see ocean_basins.read_index) is applied
+at read time.
+"""
+
+import numpy as np
+import netCDF4 as nc4
+from ocean_basins import read_box, read_lon
+from proc_pool import pool_map
+
+
+# Names of the coordinate variables in the GODAS files
+coord_names = {'tim':'timePlot', 'lev':'level', 'lat':'lat', 'lon':'lon'}
+
+
+class OceanData:
+    """ Variables read from several files, on one grid: `data[name]`
+    is a (time,lev,lat,lon) array, `tim`, `lev`, `lat`, `lon` the
+    coordinates (lon increasing across the grid edge for windows
+    crossing it) """
+
+    def __init__(self,arrays,coords):
+        self.arrays = arrays
+        for kk, vv in coords.items():
+            setattr(self,kk,vv)
+
+    def __getitem__(self,name):
+        return self.arrays[name]
+
+    def __contains__(self,name):
+        return name in self.arrays
+
+    def __iter__(self):
+        return iter(self.arrays)
+
+
+# Read one variable and the coordinates of its file (in a worker)
+def _read_var(args):
+    path, var, lat_sl, lon_sls, names = args
+    with nc4.Dataset(path,'r') as ds:
+        coords = {kk:np.asarray(ds.variables[vv][:]) for kk, vv in names.items()}
+        data = read_box(ds.variables[var],lat_sl,lon_sls)
+    coords['lat'] = coords['lat'][lat_sl]
+    coords['lon'] = read_lon(coords['lon'],lon_sls)
+    return data, coords
+
+
+def load_vars(files,window=None,nproc=None,names=coord_names):
+    """ OceanData of `files`, a dict {name: (path, variable)}, e.g.
+    {'uo':('ucur.2012.nc','ucur'), ...}. `window` is a (lat slice,
+    [lon slices]) read index (default: whole grid), `nproc` the
+    number of reader processes (default: all cores, at most one per
+    variable; 1 = serial). """
+    lat_sl, lon_sls = window or (slice(None),[slice(None)])
+    args = [(path,var,lat_sl,lon_sls,names) for path, var in files.values()]
+    parts = pool_map(_read_var,args,nproc)
+    # All the files must be on the same grid
+    keys = list(files)
+    shape0, coords0 = parts[0][0].shape, parts[0][1]
+    for key, (data, coords) in zip(keys[1:],parts[1:]):
+        if data.shape != shape0:
+            raise ValueError('%s: shape %s, %s has %s'
+                             % (key,data.shape,keys[0],shape0))
+        for kk in coords0:
+            if coords[kk].shape != coords0[kk].shape or \
+               not np.allclose(coords[kk],coords0[kk]):
+                raise ValueError('%s: coordinate %s differs from %s'
+                                 % (key,names[kk],keys[0]))
+    return OceanData({kk:pp[0] for kk, pp in zip(keys,parts)},coords0)
+
+
+def read_coords(path,names=coord_names):
+    """ Coordinates of a file (to build a read window) """
+    with nc4.Dataset(path,'r') as ds:
+        return {kk:np.asarray(ds.variables[vv][:]) for kk, vv in names.items()}
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""
+Nan-encoded ocean fields with a shared land/sea mask.
+
+GODAS files flag land (and missing) points with large fill values,
+which ocean_state.py turns into numpy.ma masked arrays: one boolean
+array per variable, the size of the data, and slow masked reductions.
+Here the mask of valid (sea) points is computed once per grid, as the
+points valid at all the time steps (a point with a fill value at any
+time is left out at all times, so that no fill value reaches the
+sums), and shared by all the variables on that grid, while the
+fields are kept as float32 with nan over land. Means over sea points
+only (e.g. zonal means) are then nan-aware reductions (see
+clim_stat.zonal_mean), or use the mask directly (see the `masks` of
+clim_stat.StatAccum).
+"""
+
+import numpy as np
+
+
+# Thresholds above which GODAS values are fill values
+fill_thresh = {'ucur':3.9, 'vcur':3.9, 'pottmp':330.}
+
+
+def sea_mask(var,thresh):
+    """ (lev,lat,lon) mask of the points valid at all the time steps
+    of a (time,lev,lat,lon) field (one step at a time, no full-size
+    temporary) """
+    valid = np.ones(var.shape[1:],dtype=bool)
+    for it in range(var.shape[0]):
+        var_t = var[it]
+        valid &= ~np.ma.getmaskarray(var_t)
+        valid &= np.ma.getdata(var_t) <= thresh
+    return valid
+
+
+def nan_fill(var,mask):
+    """ float32 array with nan outside the (lev,lat,lon) `mask`.
+    Data already in float32 are filled in place (no copy). """
+    data = np.ma.getdata(var)
+    if data.dtype != np.float32 or not data.flags.writeable:
+        data = data.astype('f')
+    np.copyto(data,np.float32(np.nan),where=~mask)
+    return data
@@ -1,18 +1,35 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
-import netCDF4 as nc4
 import numpy.ma as ma
+from functools import partial
+from clim_stat import stream_stat
+from ocean_mask import sea_mask, nan_fill, fill_thresh
+from ocean_basins import basin_masks, basin_label, read_index
+from ocean_io import load_vars, read_coords
+from ocean_transp import cell_weights, heat_transport, overturning
+from fig_batch import render_all
 
 # Setup parameters and constants
 make_clim = 1
 make_tran = True
+use_nan = True # nan-encoded float32 fields and shared sea masks (faster
+               # than numpy.ma, same means over the sea points)
+# Basins/sectors of the transports: names in ocean_basins.basins or
+# (lon1,lon2,lat1,lat2) boxes, e.g. ['atlantic','indo_pacific'] or
+# [(300,20,-35,65)]. Only the window covering them is read from file.
+tran_basins = ['global']
+make_batch = False # Render all months/levels to files (headless)
+batch_path = './ocean_figs/'
 
 # Select the background map library
 map_type = 'nomap'
 #map_type = 'basemap'
 #map_type = 'cartopy'
 
+if make_batch is True:
+    plt.switch_backend('Agg') # no windows: figures are rendered to files
+
 if map_type == 'basemap':
     from mpl_toolkits.basemap import Basemap
     # Define a Basemap object for plotting
@@ -34,43 +51,42 @@ if map_type == 'cartopy':
         return ax
 
 
-# Compute annual and zonal means, and deviations
-def comp_stat(var):
-    var_am = np.mean(var,axis=0)
-    var_zm = np.mean(var,axis=3)
-    var_pp = var - var_am[None,:,:,:]  # prime 
-    var_ss = var - var_zm[:,:,:,None]  # star
-    return var_am, var_zm, var_pp, var_ss
-
-
 # Open oceanic data
 data_path = './atmo_ocean_data/'
-var_file = nc4.Dataset(data_path+'ucur.2012.nc','r')
-# time/lev/lat/lon
-uo   = var_file.variables['ucur'][:]
-uo   = ma.masked_array(uo,mask=uo>3.9)
-tim  = var_file.variables['timePlot'][:]
-lev  = var_file.variables['level'][:]
-lat  = var_file.variables['lat'][:]
-lon  = var_file.variables['lon'][:]
-var_file.close()
-
-var_file = nc4.Dataset(data_path+'vcur.2012.nc','r')
-# time/lev/lat/lon
-vo = var_file.variables['vcur'][:]
-vo = ma.masked_array(vo,mask=vo>3.9)
-var_file.close()
-
-var_file = nc4.Dataset(data_path+'pottmp.2012.nc','r')
-# time/lev/lat/lon
-theta = var_file.variables['pottmp'][:]
-theta = ma.masked_array(theta,mask=theta>330)
-var_file.close()
-
-
-# Select here the longitude band (vo = vo[:,:,:,-60:0])
-theta_am, theta_zm, theta_pp, theta_ss = comp_stat(theta)
-vo_am, vo_zm, vo_pp, vo_ss = comp_stat(vo)
+# Window of the basins (lat slice and one or two lon slices)
+coords = read_coords(data_path+'ucur.2012.nc')
+window = read_index(tran_basins,coords['lat'],coords['lon'])
+# Read the three files concurrently (time/lev/lat/lon)
+ocean = load_vars({'uo':(data_path+'ucur.2012.nc','ucur'),
+                   'vo':(data_path+'vcur.2012.nc','vcur'),
+                   'theta':(data_path+'pottmp.2012.nc','pottmp')},window)
+tim, lev, lat, lon = ocean.tim, ocean.lev, ocean.lat, ocean.lon
+uo, vo, theta = ocean['uo'], ocean['vo'], ocean['theta']
+if use_nan is True: # one mask for u and v (same grid)
+    uv_mask = sea_mask(uo,fill_thresh['ucur']) & sea_mask(vo,fill_thresh['vcur'])
+    uo   = nan_fill(uo,uv_mask)
+    vo   = nan_fill(vo,uv_mask)
+    t_mask = sea_mask(theta,fill_thresh['pottmp'])
+    theta = nan_fill(theta,t_mask)
+else:
+    uo   = ma.masked_array(uo,mask=uo>fill_thresh['ucur'])
+    vo   = ma.masked_array(vo,mask=vo>fill_thresh['vcur'])
+    theta = ma.masked_array(theta,mask=theta>fill_thresh['pottmp'])
+
+masks = None
+if use_nan is True:
+    masks = {'theta':t_mask,'vo':uv_mask}
+
+bmask = basin_masks(tran_basins,lat,lon)
+
+
+# Annual and zonal means, and eddy covariances, in one pass for all
+# the basins (land points are excluded, as in numpy.ma means)
+stats = stream_stat({'theta':theta,'vo':vo},pairs=[('vo','theta')],
+                    masks=masks,bmask=bmask).result()
+# Zonal means: basin/time/lev/lat (first basin below)
+theta_am, theta_zm = stats['am']['theta'], stats['zm']['theta'][0]
+vo_am, vo_zm = stats['am']['vo'], stats['zm']['vo'][0]
 
 
 if make_clim is True:
@@ -139,58 +155,135 @@ if make_tran is True:
    
 
    # Fig 13.5 PO92
-   var_am = theta_am; var_pp = theta_pp; var_ss = theta_ss; var_name = 'Heat'; var_uni = 'K m/s' 
-
-   plt.figure() 
-   clevs = np.linspace(-.1,.1,11) 
-   plt.contour(lat,lev,np.mean(np.mean(vo_pp*var_pp,axis=0),axis=2),levels=clevs,colors='k')
-   plt.contourf(lat,lev,np.mean(np.mean(vo_pp*var_pp,axis=0),axis=2),levels=clevs,cmap='bwr')
-   plt.xlim([-80,80])
-   #plt.ylim([max(lev),min(lev)])
-   plt.ylim([400,0])
-   plt.colorbar(orientation='horizontal')
-   plt.xlabel('Latitude (deg)')
-   plt.ylabel('Depth (m)')
-   plt.title(var_name+' -- transient eddies ('+var_uni+')') 
-
-   plt.figure() 
-   clevs = np.linspace(-.1,.1,11)
-   plt.contour(lat,lev,np.mean(np.mean(vo_ss,axis=0)*np.mean(var_ss,axis=0),axis=2),levels=clevs,colors='k')
-   plt.contourf(lat,lev,np.mean(np.mean(vo_ss,axis=0)*np.mean(var_ss,axis=0),axis=2),levels=clevs,cmap='bwr')  
-   plt.xlim([-80,80])
-   #plt.ylim([max(lev),min(lev)])
-   plt.ylim([400,0])
-   plt.colorbar(orientation='horizontal')
-   plt.xlabel('Latitude (deg)')
-   plt.ylabel('Depth (m)')
-   plt.title(var_name+' -- stationary eddies ('+var_uni+')') 
-
-   plt.figure() 
-   clevs = np.linspace(-5,5,11)
-   #plt.contour(lat,lev,np.mean(vo_am,axis=2)*np.mean(var_am,axis=2),levels=clevs,colors='k')
-   #plt.contourf(lat,lev,np.mean(vo_am,axis=2)*np.mean(var_am,axis=2),levels=clevs,cmap='bwr')  
-   plt.contourf(lat,lev,np.mean(vo_am,axis=2)*np.mean(var_am,axis=2),levels=clevs,cmap='bwr',extend='both')  
+   var_pair = ('vo','theta'); var_name = 'Heat'; var_uni = 'K m/s' 
+   for ib, basin in enumerate(tran_basins):
+      bname = basin_label(basin)
+      var_tran = stats['tran'][var_pair][ib] # transient eddies
+      var_stat = stats['stat'][var_pair][ib] # stationary eddies
+      var_mean = stats['mean'][var_pair][ib] # mean circulation
+
+      plt.figure() 
+      clevs = np.linspace(-.1,.1,11) 
+      plt.contour(lat,lev,var_tran,levels=clevs,colors='k')
+      plt.contourf(lat,lev,var_tran,levels=clevs,cmap='bwr')
+      plt.xlim([-80,80])
+      #plt.ylim([max(lev),min(lev)])
+      plt.ylim([400,0])
+      plt.colorbar(orientation='horizontal')
+      plt.xlabel('Latitude (deg)')
+      plt.ylabel('Depth (m)')
+      plt.title(bname+' '+var_name+' -- transient eddies ('+var_uni+')') 
+
+      plt.figure() 
+      clevs = np.linspace(-.1,.1,11)
+      plt.contour(lat,lev,var_stat,levels=clevs,colors='k')
+      plt.contourf(lat,lev,var_stat,levels=clevs,cmap='bwr')  
+      plt.xlim([-80,80])
+      #plt.ylim([max(lev),min(lev)])
+      plt.ylim([400,0])
+      plt.colorbar(orientation='horizontal')
+      plt.xlabel('Latitude (deg)')
+      plt.ylabel('Depth (m)')
+      plt.title(bname+' '+var_name+' -- stationary eddies ('+var_uni+')') 
+
+      plt.figure() 
+      clevs = np.linspace(-5,5,11)
+      #plt.contour(lat,lev,var_mean,levels=clevs,colors='k')
+      #plt.contourf(lat,lev,var_mean,levels=clevs,cmap='bwr')  
+      plt.contourf(lat,lev,var_mean,levels=clevs,cmap='bwr',extend='both')  
+      plt.xlim([-80,80])
+      #plt.ylim([max(lev),min(lev)])
+      plt.ylim([400,0])
+      plt.colorbar(orientation='horizontal')
+      plt.xlabel('Latitude (deg)')
+      plt.ylabel('Depth (m)')
+      plt.title(bname+' '+var_name+' -- mean circulation ('+var_uni+')') 
+
+   # Meridional heat transport (PW) and overturning streamfunction (Sv),
+   # all months and basins at once (sea cells only)
+   tmask = None
+   if use_nan is True:
+      tmask = uv_mask & t_mask
+   wgt = cell_weights(lev,lat,lon,tmask,bmask)
+   heat_tr = heat_transport(vo,theta,wgt) # time/basin/lat
+   psi = overturning(vo,wgt) # time/basin/lev/lat
+
+   plt.figure()
+   for ib, basin in enumerate(tran_basins):
+      plt.plot(lat,np.mean(heat_tr[:,ib],axis=0),label=basin_label(basin))
    plt.xlim([-80,80])
-   #plt.ylim([max(lev),min(lev)])
-   plt.ylim([400,0])
-   plt.colorbar(orientation='horizontal')
+   plt.legend()
    plt.xlabel('Latitude (deg)')
-   plt.ylabel('Depth (m)')
-   plt.title(var_name+' -- mean circulation ('+var_uni+')') 
-
-   # TODO add meridional profiles
-   # Layer thickness
-   #levp = np.append(lev[1::],lev[-1])
-   #dlev = levp-lev
-   #plt.figure()
-   #plt.plot(lat,vo_am[23,:,-30]*var_am[23,:,-30])
-   #plt.plot(lat,np.sum(np.mean(vo_am,axis=2)*np.mean(var_am,axis=2)*dlev[:,None],axis=0))
-   #plt.plot(lat,np.sum((vo_am[:,:,-33]*var_am[:,:,-33]*dlev[:,None])[0:15],axis=0))
+   plt.ylabel('PW')
+   plt.title('Ocean heat transport -- annual mean')
+
+   for ib, basin in enumerate(tran_basins):
+      plt.figure()
+      clevs = np.linspace(-30,30,13)
+      plt.contourf(lat,lev,np.mean(psi[:,ib],axis=0),levels=clevs,cmap='bwr',extend='both')
+      plt.xlim([-80,80])
+      plt.ylim([max(lev),min(lev)])
+      plt.colorbar(orientation='horizontal')
+      plt.xlabel('Latitude (deg)')
+      plt.ylabel('Depth (m)')
+      plt.title(basin_label(basin)+' overturning streamfunction (Sv)')
 
    plt.show()
-   
- 
-
-
 
 
+if make_batch is True:
+
+    # Map slabs, sliced by the workers from the fields they inherit
+    def speed_slab(imon,jlev):
+        return np.sqrt(uo[imon,jlev]**2+vo[imon,jlev]**2)
+
+    def theta_slab(imon,jlev):
+        return theta[imon,jlev]
+
+    # One spec per figure: zonal mean theta for each month, currents
+    # and theta maps for each month and level, transports per basin
+    specs = []
+    for imon in range(len(tim)):
+        specs.append({'fname':'theta_zm_m%02i' % (imon+1),
+                      'x':lat, 'y':lev, 'z':theta_zm[imon],
+                      'levels':np.linspace(260,300,11), 'colorbar':'vertical',
+                      'ylim':[max(lev),min(lev)],
+                      'xlabel':'Latitude (deg)', 'ylabel':'Depth (m)',
+                      'title':'Temperature month= %i' % (imon+1)})
+        for jlev in range(len(lev)):
+            specs.append({'fname':'curr_m%02i_%04im' % (imon+1,lev[jlev]),
+                          'x':lon, 'y':lat, 'z':partial(speed_slab,imon,jlev),
+                          'levels':np.arange(10)*0.1, 'cmap':'Reds',
+                          'colorbar':'horizontal',
+                          'title':'Currents month= %i @ %i m' % (imon+1,lev[jlev])})
+            specs.append({'fname':'theta_m%02i_%04im' % (imon+1,lev[jlev]),
+                          'x':lon, 'y':lat, 'z':partial(theta_slab,imon,jlev),
+                          'levels':270+np.arange(11)*3, 'cmap':'bwr',
+                          'extend':'both', 'colorbar':'horizontal',
+                          'title':'Theta month= %i @ %i m' % (imon+1,lev[jlev])})
+    if make_tran is True:
+        for ib, basin in enumerate(tran_basins):
+            bname = basin_label(basin)
+            for term, clevs, lab in [('tran',np.linspace(-.1,.1,11),'transient eddies'),
+                                     ('stat',np.linspace(-.1,.1,11),'stationary eddies'),
+                                     ('mean',np.linspace(-5,5,11),'mean circulation')]:
+                specs.append({'fname':'heat_%s_%s' % (term,bname.lower()),
+                              'x':lat, 'y':lev, 'z':stats[term][var_pair][ib],
+                              'levels':clevs, 'cmap':'bwr', 'extend':'both',
+                              'colorbar':'horizontal', 'xlim':[-80,80], 'ylim':[400,0],
+                              'xlabel':'Latitude (deg)', 'ylabel':'Depth (m)',
+                              'title':bname+' '+var_name+' -- '+lab+' ('+var_uni+')'})
+            specs.append({'fname':'psi_%s' % bname.lower(),
+                          'x':lat, 'y':lev, 'z':np.mean(psi[:,ib],axis=0),
+                          'levels':np.linspace(-30,30,13), 'cmap':'bwr',
+                          'extend':'both', 'colorbar':'horizontal',
+                          'xlim':[-80,80], 'ylim':[max(lev),min(lev)],
+                          'xlabel':'Latitude (deg)', 'ylabel':'Depth (m)',
+                          'title':bname+' overturning streamfunction (Sv)'})
+        specs.append({'fname':'heat_transport',
+                      'lines':[(lat,np.mean(heat_tr[:,ib],axis=0),'-',basin_label(basin))
+                               for ib, basin in enumerate(tran_basins)],
+                      'xlim':[-80,80], 'legend':True,
+                      'xlabel':'Latitude (deg)', 'ylabel':'PW',
+                      'title':'Ocean heat transport -- annual mean'})
+    render_all(specs,batch_path)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Ocean meridional heat transport and overturning streamfunction.
+
+Zonal and vertical integrals of v*theta and v over each basin:
+ - heat transport: rho cp int int v (theta-t_ref) dx dz (PW)
+ - overturning: psi(z,lat) = int_z^0 int v dx dz' (Sv), positive for
+   a northward flow above z (clockwise cell, e.g. the AMOC)
+The cell widths dx (from lat/lon) and the layer thicknesses dz (see
+vert_int.layer_weights) are cached per grid, and combined with the
+sea mask and the basin masks into one (nb,lev,lat,lon) array of cell
+weights. All months and basins are then computed by a single
+contraction over lon (and lev), with land and missing points as 0.
+"""
+
+from functools import lru_cache
+import numpy as np
+from vert_int import layer_weights, r_e
+
+
+rho_o = 1025. # sea water density (kg/m3)
+cp_o = 3996. # sea water heat capacity (J/kg/K)
+
+
+@lru_cache(maxsize=16)
+def _widths(lat,lon):
+    dlon = np.abs(np.gradient(np.array(lon)))*np.pi/180.
+    coslat = np.cos(np.array(lat)*np.pi/180.)
+    dx = r_e*coslat[:,None]*dlon[None,:]
+    dx.setflags(write=False)
+    return dx
+
+
+def cell_widths(lat,lon):
+    """ Zonal widths (m) of the (lat,lon) cells, cached per grid """
+    return _widths(tuple(float(ll) for ll in np.asarray(lat)),
+                   tuple(float(ll) for ll in np.asarray(lon)))
+
+
+def cell_weights(lev,lat,lon,mask=None,bmask=None,method='layer'):
+    """ (nb,lev,lat,lon) weights dz*dx (m2) of the sea cells of each
+    basin (`mask` (lev,lat,lon) of sea points, `bmask` (nb,lat,lon)
+    basin masks; default: all points, one basin) """
+    dz = layer_weights(lev,coord='depth',method=method)
+    wgt = dz[:,None,None]*cell_widths(lat,lon)[None]
+    if mask is not None:
+        wgt = np.where(mask,wgt,0.)
+    if bmask is None:
+        return wgt[None]
+    return np.where(bmask[:,None],wgt[None],0.)
+
+
+# Land and missing (masked or nan) points set to 0
+def _fill0(xx):
+    xx = np.ma.filled(xx,0.) if np.ma.isMaskedArray(xx) else np.asarray(xx)
+    return np.where(np.isfinite(xx),xx,0.)
+
+
+def heat_transport(vo,theta,wgt,t_ref=273.15,rho=rho_o,cp=cp_o):
+    """ Northward heat transport (PW) of (time,lev,lat,lon) fields,
+    for the (nb,lev,lat,lon) weights `wgt`: (time,nb,lat) """
+    vt = _fill0(vo)*_fill0(theta-t_ref)
+    return np.einsum('tzyx,bzyx->tby',vt,wgt,optimize=True)*rho*cp*1E-15
+
+
+def overturning(vo,wgt):
+    """ Overturning streamfunction (Sv) of a (time,lev,lat,lon)
+    meridional velocity, at the bottom of each layer: (time,nb,lev,lat) """
+    vol = np.einsum('tzyx,bzyx->tbzy',_fill0(vo),wgt,optimize=True)
+    return np.cumsum(vol,axis=2)*1E-6
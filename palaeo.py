@@ -2,9 +2,15 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
+from fig_batch import render_all
 
 # Location of the txt files. Adapt as needed.
 data_path = './palaeo_data/'
+make_batch = False # Render each panel to its own file (headless)
+batch_path = './palaeo_figs/'
+
+if make_batch is True:
+    plt.switch_backend('Agg') # no windows: figures are rendered to files
 
 # Warning: EPICA files may give you system-dependent coding errors.
 # In case, delete the header (whole or in part) and adjust the 
@@ -126,6 +132,35 @@ plt.ylim([1E-5,1])
 plt.xlabel('Freq [kyr-1]')
 plt.legend()
 
+if make_batch is True:
+
+    # One spec per panel of the figure above
+    specs = [{'fname':'zachos_o18','lines':[(zachos_o18[:,0],zachos_o18[:,2],'k',None)],
+              'xlim':[0,60],'xlabel':'mya','ylabel':'Delta 18O'},
+             {'fname':'vostok_epica','xlim':[0,5E2],'ylim':[-50,100],
+              'lines':[(vostok_co2[:,0]/1E3,vostok_co2[:,1]-200,'k','Vostok CO2 - 200'),
+                       (epica_co2[:,1]/1E3,epica_co2[:,2]-200,'-','EPICA CO2'),
+                       (vostok_t[:,1]/1E3,vostok_t[:,3]*5,'-','Vostok T x 5')],
+              'xlabel':'kya','ylabel':'[ppmv-] & [K*]','legend':True},
+             {'fname':'vostok_200kya','xlim':[0,2E2],
+              'lines':[(vostok_co2[:,0]/1E3,vostok_co2[:,1]-200,'-',None),
+                       (vostok_t[:,1]/1E3,vostok_t[:,3]*5,'-',None)],
+              'xlabel':'kya','ylabel':'[ppmv-] & [K*]'},
+             {'fname':'vostok_t_co2','xlim':[-10,5],'ylim':[180,300],
+              'lines':[(vostok_t_int,vostok_co2[:,1],'kx',None)],
+              'xlabel':'T [K]','ylabel':'CO2 [ppmv]','title':'Vostok'},
+             {'fname':'vostok_orbit','xlim':[0,5E2],
+              'lines':[(vostok_co2[:,0]/1E3,vostok_co2[:,1]*1.5,'-',None),
+                       (-orbit[:,0],orbit[:,5],'-',None)],
+              'xlabel':'kya','ylabel':'[K*] & [W/m2]'},
+             {'fname':'orbit_fft','xscale':'log','yscale':'log',
+              'xlim':[1e-3,1e-1],'ylim':[1E-5,1],
+              'lines':[(orbit_freq[1:],ecc_fft[1:],'b','ecc'),
+                       (orbit_freq[1:],obl_fft[1:],'k','obl'),
+                       (orbit_freq[1:],pre_fft[1:],'r','prec')],
+              'xlabel':'Freq [kyr-1]','legend':True}]
+    render_all(specs,batch_path)
+
 plt.show()
 
 
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""
+Process pool for the course scripts.
+
+The scripts have no __main__ guard, so only the 'fork' start method
+can be used (with 'spawn' the workers would rerun the calling
+script); where it is not available, or with a single process, the
+work is done serially. Workers drop the netCDF handles inherited
+from the parent process (nc_lazy), which must not be shared.
+"""
+
+import os
+import sys
+import multiprocessing as mp
+
+
+# Workers must not reuse the netCDF handles of the parent process
+def _init_worker(initializer=None):
+    if 'nc_lazy' in sys.modules:
+        sys.modules['nc_lazy']._handles.clear()
+    if initializer is not None:
+        initializer()
+
+
+def pool_imap(func,args,nproc=None,initializer=None,ordered=True):
+    """ Iterator over func(arg) for all `args`, computed by `nproc`
+    worker processes (default: all cores, at most one per arg; 1 =
+    serial), in the order of `args` or, if not `ordered`, as they
+    arrive (e.g. for a running reduction) """
+    args = list(args)
+    if nproc is None:
+        nproc = os.cpu_count() or 1
+    nproc = min(nproc,len(args))
+    if nproc <= 1 or 'fork' not in mp.get_all_start_methods():
+        for arg in args:
+            yield func(arg)
+        return
+    chunksize = max(1,len(args)//(4*nproc))
+    with mp.get_context('fork').Pool(nproc,initializer=_init_worker,
+                                     initargs=(initializer,)) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for res in imap(func,args,chunksize=chunksize):
+            yield res
+
+
+def pool_map(func,args,nproc=None,initializer=None):
+    """ List of func(arg) for all `args`, in order (see pool_imap) """
+    return list(pool_imap(func,args,nproc,initializer))
@@ -1,10 +1,20 @@
 #!/usr/bin/env python
 import numpy as np
 import matplotlib.pyplot as plt
+from functools import partial
+from erbe_io import read_erbe
+from erbe_grid import regrid
+from erbe_cube import load_cube
+from wgt_mean import area_weights, wgt_mean
+from heat_transp import implied_transport
+from fig_batch import render_all
 
 # Setup parameters and constants
 make_maps = True  # Show global maps
 make_ts   = False   # Show zonal averages
+make_season = False # Seasonal cycle maps from all the monthly files
+make_batch = False # Render the maps of every monthly file to files (headless)
+batch_path = './rad_figs/'
 dgrid = 2.5        # ERBE data resolution (degrees)
 r_e = 6.371*1E6    # Earth radius (m)
 
@@ -13,6 +23,9 @@ map_type = 'nomap'
 #map_type = 'basemap'
 #map_type = 'cartopy'
 
+if make_batch is True:
+    plt.switch_backend('Agg') # no windows: figures are rendered to files
+
 
 if map_type == 'basemap':
 
@@ -47,69 +60,50 @@ data_path = './radiation_data/' # CHANGEME
 13  NET CLOUD FORCING        
 """
 
-# Open ERBE year/month 2D data, and select columns
-erbe_2d = np.genfromtxt(data_path+'ERBE_01_1987.txt',\
-                        skip_header=19,dtype='str',delimiter='?')
+# Open ERBE year/month 2D data, and select columns (see erbe_io.erbe_cols;
+# missing values are nan, glued negative values are split)
+erbe_2d = read_erbe(data_path+'ERBE_01_1987.txt',cols=('lat','lon','sw','lw','alb'))
 
-lat_2d = np.array([float(row.split()[0]) for row in erbe_2d],dtype='f') 
-lon_2d = np.array([float(row.split()[1]) for row in erbe_2d],dtype='f')
+lat_2d = erbe_2d['lat']
+lon_2d = erbe_2d['lon']
 
 # Shortwave radiation (reflected)
-sw_2d =  np.array([float(row.split()[2]) for row in erbe_2d],dtype='f')
-sw_2d[np.where(sw_2d == 999.99)] = float('nan')
+sw_2d = erbe_2d['sw']
 
 # Longwave radiation
-lw_2d =  np.array([float(row.split()[3].split('-')[0]) 
-                  for row in erbe_2d],dtype='f')
-#net_2d =  np.array([float(row.split()[1]) for row in erbe_2d],dtype='f')
+lw_2d = erbe_2d['lw']
+#net_2d = erbe_2d['net']
 
 # Albedo
-alb_2d =  np.array([float(row.split()[5]) for row in erbe_2d],dtype='f')
+alb_2d = erbe_2d['alb']
 alb_2d[np.where(alb_2d == 0.0)] = float('nan') # suspect
-alb_2d[np.where(alb_2d == 999.99)] = float('nan')
 
-# Clear-sky quantities
-#cssw_2d =  np.array([float(row.split()[1]) for row in erbe_2d],dtype='f')
-#cslw_2d =  np.array([float(row.split()[1]) for row in erbe_2d],dtype='f')
-#csa_2d =  np.array([float(row.split()[1]) for row in erbe_2d],dtype='f')
+# Clear-sky quantities (add their columns to `cols` above)
+#cssw_2d = erbe_2d['cs_sw']
+#cslw_2d = erbe_2d['cs_lw']
+#csa_2d = erbe_2d['cs_alb']
 
 # Define regular lon/lat grid at 2.5 deg step
 lon_rg = np.linspace(0,357.5,int(360/2.5))
 lat_rg = np.linspace(-90,90,int(180/2.5)+1)
 
-# Define regridded variables
-sw_rg  = np.zeros((len(lon_rg),len(lat_rg)),dtype='f')
-lw_rg  = np.zeros((len(lon_rg),len(lat_rg)),dtype='f')
-alb_rg = np.zeros((len(lon_rg),len(lat_rg)),dtype='f')
-
-# Fill with missing values to start
-sw_rg[:]  = float('nan')
-lw_rg[:]  = float('nan')
-alb_rg[:] =  float('nan')
-
-# Reshape into bidimensional array
-for ind in range(len(lat_2d)):
-
-    # Get the current indices
-    lon_ind = np.abs(lon_rg-lon_2d[ind]).argmin()    
-    lat_ind = np.abs(lat_rg-lat_2d[ind]).argmin()    
-
-    # Assign the corresponding values
-    sw_rg[lon_ind,lat_ind]  = sw_2d[ind]
-    lw_rg[lon_ind,lat_ind]  = lw_2d[ind]
-    alb_rg[lon_ind,lat_ind] = alb_2d[ind]
+# Reshape into bidimensional (lon,lat) arrays, nan where missing
+# (nearest grid point of each record, index map cached per grid)
+erbe_rg = regrid({'lat':lat_2d,'lon':lon_2d,'sw':sw_2d,'lw':lw_2d,'alb':alb_2d},
+                 ['sw','lw','alb'],lat_rg,lon_rg)
+sw_rg, lw_rg, alb_rg = erbe_rg['sw'], erbe_rg['lw'], erbe_rg['alb']
 
 # Compute incoming shortwave
 sw_in=100.*sw_rg/alb_rg 
 #((100.-alb_rg)/alb_rg)*sw_rg ??
 
-if make_maps is True:
+alb_levs = np.linspace(0,50,11)
+sw_levs  = np.linspace(50,250,11)
+in_levs  = np.linspace(200,500,11)
+abs_levs = np.linspace(100,400,11)
+lw_levs  = np.linspace(100,350,11)
 
-    alb_levs = np.linspace(0,50,11)
-    sw_levs  = np.linspace(50,250,11)
-    in_levs  = np.linspace(200,500,11)
-    abs_levs = np.linspace(100,400,11)
-    #lw_levs  = ... TODO
+if make_maps is True:
 
     plt.figure()
 
@@ -183,6 +177,23 @@ if make_maps is True:
 
 
 
+# *** Seasonal cycle from all the ERBE_MM_YYYY.txt files ***
+if make_season is True:
+    # (time,lat,lon) cubes, parsed once and then read from erbe_cube.npz
+    erbe_3d = load_cube(data_path,names=('sw','lw','alb'))
+    imon = erbe_3d['date'] % 100
+    sw_seas = np.array([np.nanmean(erbe_3d['sw'][imon == mm],axis=0)
+                        for mm in range(1,13)])
+
+    plt.figure()
+    plt.contourf(erbe_3d['lon'],erbe_3d['lat'],
+                 np.mean(sw_seas[5:8],axis=0)-np.mean(sw_seas[[11,0,1]],axis=0),
+                 levels=np.linspace(-150,150,13),cmap='bwr',extend='both')
+    plt.colorbar(orientation='horizontal')
+    plt.title('Reflected SW, JJA-DJF [W/m2]')
+
+
+
 # *** Zonally averaged quantities *** 
 # Dims: lat, month, annual mean (14 columns)
 net_1d  = np.array(np.loadtxt(data_path+'NET1986.txt',skiprows=1))
@@ -190,34 +201,28 @@ olr_1d  = np.array(np.loadtxt(data_path+'OLR1986.txt',skiprows=1))
 alb_1d  = np.array(np.loadtxt(data_path+'ALB1986.txt',skiprows=1))
 sw_1d   = np.array(np.loadtxt(data_path+'SW1986.txt',skiprows=1))
 lat_1d  = np.array(net_1d[:,0])
-lat_wgt = np.cos(lat_1d*np.pi/180.)*r_e*r_e*(dgrid*np.pi/180.)
-
-
-# Prepare monthly time series
-net_ts = np.zeros(12,dtype='f')
-sw_ts  = np.zeros(12,dtype='f')
-olr_ts = np.zeros(12,dtype='f')
-alb_ts = np.zeros(12,dtype='f')
-abs_ts = np.zeros(12,dtype='f')
+lat_wgt = area_weights(lat_1d,dlat=dgrid,r_e=r_e) # cached per grid
 
+# Absorbed shortwave, nan where the albedo is missing (0 or 999.99)
+alb_ok = np.where((alb_1d > 0) & (alb_1d != 999.99),alb_1d,np.nan)
+abs_1d = sw_1d/alb_ok*(100.-alb_ok)
+abs_1d[:,0] = lat_1d # keep the latitude column
 
-for mon in range(12):
-   net_ts[mon] = np.sum(net_1d[:,mon+1]*lat_wgt)/np.sum(lat_wgt)
-   olr_ts[mon] = np.sum(olr_1d[:,mon+1]*lat_wgt)/np.sum(lat_wgt)
-   sw_ts[mon]  = np.sum(sw_1d[:,mon+1]*lat_wgt)/np.sum(lat_wgt)
+# Monthly time series, all months and variables in one weighted mean
+net_ts, olr_ts, sw_ts, abs_ts = wgt_mean(np.stack([net_1d,olr_1d,sw_1d,abs_1d])[:,:,1:13],
+                                         lat_wgt,axis=1).astype('f')
 
-   ind_mon = np.where(alb_1d[:,mon+1] > 0)
-   abs_ts[mon] = np.sum(sw_1d[ind_mon,mon+1]/alb_1d[ind_mon,mon+1]*\
-                 (100.-alb_1d[ind_mon,mon+1])*lat_wgt[ind_mon])/np.sum(lat_wgt[ind_mon])
+abs_ann = abs_1d[:,13] # nan where missing
 
+# Implied poleward energy transport (PW), 12 months + annual mean
+lat_edge, transp = implied_transport(net_1d[:,1:14],lat_wgt,lat_1d,dgrid)
 
-ind_ann = np.where(alb_1d[:,13] > 0) # Exclude missing values
-abs_ann = np.squeeze(sw_1d[ind_ann,13]/alb_1d[ind_ann,13]*(100.-alb_1d[ind_ann,13]))
+# Anomalies of the monthly series
+abs_anom = abs_ts - np.mean(abs_ts)
+olr_anom = -olr_ts + np.mean(olr_ts)
 
 if make_ts is True:
     plt.figure()
-    abs_anom = abs_ts - np.mean(abs_ts)
-    olr_anom = -olr_ts + np.mean(olr_ts)
     plt.plot(1+np.arange(12),net_ts,label='net')
     plt.plot(1+np.arange(12),abs_anom+olr_anom,label="abs' + olr'")
     plt.plot(1+np.arange(12),abs_anom,label="abs'")
@@ -239,6 +244,60 @@ if make_ts is True:
     plt.axhline(0,color='k')
     plt.legend()
 
+    plt.figure()
+    for mon in [0,3,6,9]:
+        plt.plot(lat_edge,transp[:,mon],label='month %i' % (mon+1))
+    plt.plot(lat_edge,transp[:,12],'k',label='annual')
+    plt.xlabel('Latitude [deg]')
+    plt.ylabel('Northward transport [PW]')
+    plt.axhline(0,color='k')
+    plt.legend()
+
+
+
+if make_batch is True:
+
+    # Maps of the file above, zonal mean plots, and albedo/sw/lw maps
+    # of every month in the cube (sliced by the workers from the cube
+    # they inherit)
+    map_kw = {'x':lon_rg, 'y':lat_rg, 'extend':'max', 'colorbar':'horizontal'}
+    specs = [dict(map_kw,fname='alb',z=alb_rg.T,levels=alb_levs,cmap='Blues_r',
+                  title='Albedo [%]'),
+             dict(map_kw,fname='sw',z=sw_rg.T,levels=sw_levs,cmap='Oranges_r',
+                  title='Reflected SW [W/m2]'),
+             dict(map_kw,fname='sw_in',z=sw_in.T,levels=in_levs,cmap='Oranges',
+                  title='Incoming SW [W/m2]'),
+             dict(map_kw,fname='sw_abs',z=(sw_in*(100-alb_rg)/100).T,levels=abs_levs,
+                  cmap='Oranges',title='(1-A) SW [W/m2]'),
+             {'fname':'ts_flux','ylim':[-20,20],'hlines':[(0,'k')],'legend':True,
+              'lines':[(1+np.arange(12),net_ts,'-','net'),
+                       (1+np.arange(12),abs_anom+olr_anom,'-',"abs' + olr'"),
+                       (1+np.arange(12),abs_anom,'-',"abs'"),
+                       (1+np.arange(12),olr_anom,'-',"olr'")],
+              'xlabel':'Month','ylabel':'Avg flux [W/m2]'},
+             {'fname':'zm_flux','hlines':[(0,'k')],'legend':True,
+              'lines':[(lat_1d,abs_ann,'-','abs'),(lat_1d,olr_1d[:,13],'-','olr'),
+                       (lat_1d,net_1d[:,13],'-','net'),
+                       (lat_1d,abs_ann-olr_1d[:,13],'-','abs-olr')],
+              'xlabel':'Latitude [deg]','ylabel':'Flux [W/m2]'},
+             {'fname':'transport','hlines':[(0,'k')],'legend':True,
+              'lines':[(lat_edge,transp[:,mon],'-','month %i' % (mon+1))
+                       for mon in [0,3,6,9]]+[(lat_edge,transp[:,12],'k','annual')],
+              'xlabel':'Latitude [deg]','ylabel':'Northward transport [PW]'}]
+
+    erbe_3d = load_cube(data_path,names=('sw','lw','alb'))
+    def cube_slab(name,it):
+        return erbe_3d[name][it]
+    for it, date in enumerate(erbe_3d['date']):
+        for name, levs, cmap, lab in [('alb',alb_levs,'Blues_r','Albedo [%]'),
+                                      ('sw',sw_levs,'Oranges_r','Reflected SW [W/m2]'),
+                                      ('lw',lw_levs,'Reds','OLR [W/m2]')]:
+            specs.append(dict(map_kw,x=erbe_3d['lon'],y=erbe_3d['lat'],
+                              fname='%s_%06i' % (name,date),z=partial(cube_slab,name,it),
+                              levels=levs,cmap=cmap,
+                              title='%s %02i/%04i' % (lab,date % 100,date//100)))
+    render_all(specs,batch_path)
+
 
 
 plt.show()
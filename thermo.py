@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Thermodynamic fields (potential temperature, equivalent potential
+temperature, ...) computed on whole (time, lev, lat, lon) cubes.
+
+Arrays are processed `nchunk` time steps at a time and kept in
+float32, so that no float64 temporary of the full 4D size is created.
+Inputs can be numpy arrays or netCDF4 variables (only the current
+chunk is read from file).
+"""
+
+import numpy as np
+
+
+# Default constants, as in atmo_state.py
+l_e = 2.5E+6 # latent heat vaporization
+rcp = 0.285 # R/Cp
+cp  = 1004. # J/kg/K
+grav = 9.81 # m/s2
+
+
+# Exner-like factor (1000/p)**(R/cp), shaped to broadcast on lev
+def exner(lev,rcp=rcp):
+    fac = (1000./np.asarray(lev,dtype='f'))**rcp
+    return fac.astype('f')[None,:,None,None]
+
+
+# Read a time chunk as float32 (masked values, if any, become nan)
+def read_chunk(var,t0,t1):
+    chunk = var[t0:t1]
+    if np.ma.isMaskedArray(chunk):
+        chunk = chunk.astype('f').filled(np.nan)
+    return np.asarray(chunk,dtype='f')
+
+
+def pot_temp(ta,lev,rcp=rcp,out=None):
+    """ Potential temperature of a (time,lev,lat,lon) chunk """
+    ta = np.asarray(ta,dtype='f')
+    if out is None:
+        out = np.empty(ta.shape,dtype='f')
+    np.multiply(ta,exner(lev,rcp),out=out)
+    return out
+
+
+def eqpot_temp(ta,qq,theta,l_e=l_e,cp=cp,out=None):
+    """ Equivalent potential temperature, given theta:
+    thetae = theta*exp(q*L/(T*cp)) """
+    ta = np.asarray(ta,dtype='f')
+    if out is None:
+        out = np.empty(ta.shape,dtype='f')
+    np.multiply(qq,np.float32(l_e/cp),out=out)
+    np.divide(out,ta,out=out)
+    np.exp(out,out=out)
+    np.multiply(out,theta,out=out)
+    return out
+
+
+def static_energy(ta,zz,qq=None,cp=cp,l_e=l_e):
+    """ Dry (qq=None) or moist static energy (J/kg), with zz
+    the geopotential (m2/s2) """
+    out = np.multiply(np.asarray(ta,dtype='f'),np.float32(cp))
+    out += np.asarray(zz,dtype='f')
+    if qq is not None:
+        out += np.float32(l_e)*np.asarray(qq,dtype='f')
+    return out
+
+
+def comp_theta(ta,qq,lev,rcp=rcp,l_e=l_e,cp=cp,nchunk=1):
+    """ Compute theta and thetae on the whole cube, in chunks
+    of `nchunk` time steps. Returns two float32 arrays. """
+    nt = ta.shape[0]
+    theta  = np.empty(ta.shape,dtype='f')
+    thetae = np.empty(ta.shape,dtype='f')
+    for t0 in range(0,nt,nchunk):
+        t1 = min(t0+nchunk,nt)
+        ta_c = read_chunk(ta,t0,t1)
+        qq_c = read_chunk(qq,t0,t1)
+        pot_temp(ta_c,lev,rcp,out=theta[t0:t1])
+        eqpot_temp(ta_c,qq_c,theta[t0:t1],l_e,cp,out=thetae[t0:t1])
+    return theta, thetae
+
+
+def add_thermo(chunk,t0=0,lev=None,rcp=rcp,l_e=l_e,cp=cp):
+    """ Add theta and thetae to a chunk dict with 't' and 'q', as a
+    `derive` function for stream_stat (use functools.partial to fix
+    lev and the constants; partials can be sent to worker processes) """
+    chunk['theta'] = pot_temp(chunk['t'],lev,rcp)
+    chunk['thetae'] = eqpot_temp(chunk['t'],chunk['q'],chunk['theta'],l_e,cp)
+    return chunk
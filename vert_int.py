@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Vertical integrals on non-uniform pressure (hPa) or depth (m) levels.
+
+Layer weights are computed once per `lev` axis and cached, then
+applied as a single contraction over the level axis of the whole
+field, e.g. (time,lev,lat,lon) -> (time,lat,lon).
+ - coord='pressure': weights are dp/g (kg/m2), so that the integral
+   of X is the column amount int X dp/g
+ - coord='depth': weights are dz (m)
+Two rules are available: 'trapz' (trapezoidal, as numpy.trapz with
+a non-constant dx) and 'layer' (each level is the centre of a layer
+bounded by the mid-points; for depth the first layer starts at 0).
+"""
+
+from functools import lru_cache
+import numpy as np
+
+
+grav = 9.81 # m/s2
+r_e = 6.371*1E6 # Earth radius (m)
+
+
+@lru_cache(maxsize=64)
+def _weights(lev,coord,method,bounds):
+    lev = np.array(lev,dtype='f8')
+    if coord == 'pressure':
+        xx = lev*100. # hPa -> Pa
+    elif coord == 'depth':
+        xx = lev
+    else:
+        raise ValueError('Unknown vertical coordinate: '+coord)
+    # Sort the levels (they can be top-down or bottom-up)
+    order = np.argsort(xx)
+    xs = xx[order]
+    wgt = np.zeros(len(xs))
+    if bounds is not None:
+        fac = 100. if coord == 'pressure' else 1.
+        sel = np.logical_and(xs >= min(bounds)*fac,xs <= max(bounds)*fac)
+    else:
+        sel = np.ones(len(xs),dtype=bool)
+    ind = np.where(sel)[0]
+    xsel = xs[ind]
+    if len(xsel) > 1:
+        if method == 'trapz':
+            dx = np.diff(xsel)
+            wgt[ind[:-1]] += dx/2.
+            wgt[ind[1:]] += dx/2.
+        elif method == 'layer':
+            mid = (xsel[1:]+xsel[:-1])/2.
+            top = 0. if (coord == 'depth' and bounds is None) else xsel[0]
+            edges = np.concatenate(([top],mid,[xsel[-1]]))
+            wgt[ind] = np.diff(edges)
+        else:
+            raise ValueError('Unknown integration rule: '+method)
+    if coord == 'pressure':
+        wgt /= grav
+    out = np.zeros(len(xx))
+    out[order] = wgt
+    out.setflags(write=False)
+    return out
+
+
+def layer_weights(lev,coord='pressure',method='trapz',bounds=None):
+    """ Weights (dp/g or dz) for the levels `lev`, cached per axis.
+    `bounds` = (lev1,lev2) limits the integral to that range. """
+    lev = tuple(float(ll) for ll in np.asarray(lev).ravel())
+    if bounds is not None:
+        bounds = (float(bounds[0]),float(bounds[1]))
+    return _weights(lev,coord,method,bounds)
+
+
+def vert_int(var,lev,coord='pressure',axis=1,method='trapz',bounds=None,
+             mean=False,skipna=False):
+    """ Integral (or weighted mean, if `mean`) of `var` along the
+    level `axis`, as one contraction. With `skipna`, nan points are
+    left out (and the mean is normalized by the valid weights). """
+    wgt = layer_weights(lev,coord,method,bounds)
+    var = np.asarray(var)
+    if skipna:
+        valid = np.isfinite(var)
+        out = np.tensordot(np.where(valid,var,0.),wgt,axes=([axis],[0]))
+        if mean:
+            wsum = np.tensordot(valid,wgt,axes=([axis],[0]))
+            with np.errstate(invalid='ignore',divide='ignore'):
+                out = np.where(wsum > 0,out/np.maximum(wsum,1E-30),np.nan)
+        return out
+    out = np.tensordot(var,wgt,axes=([axis],[0]))
+    if mean:
+        out /= np.sum(wgt)
+    return out
+
+
+def vert_mean(var,lev,coord='pressure',axis=1,method='trapz',bounds=None,
+              skipna=False):
+    """ Mass (or thickness) weighted vertical mean """
+    return vert_int(var,lev,coord,axis,method,bounds,True,skipna)
+
+
+def col_transport(flux,lev,lat,fac=1.,lev_axis=-2,method='trapz'):
+    """ Northward transport (W) across each latitude of zonal mean
+    fluxes `flux` (...,lev,lat), e.g. [vT] in K m/s:
+    2 pi a cos(lat) * int fac*flux dp/g, with fac = cp for sensible
+    heat, L for latent heat, 1 for geopotential. Leading dimensions
+    (months, terms, ...) are integrated all at once. """
+    wgt = layer_weights(lev,'pressure',method)
+    col = np.tensordot(np.moveaxis(np.asarray(flux),lev_axis,-1),wgt,axes=1)
+    circ = 2.*np.pi*r_e*np.cos(np.asarray(lat)*np.pi/180.)
+    return np.multiply(fac,col)*circ
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Area-weighted means over latitude (and longitude), for all the
+months and variables at once.
+
+Cell areas are cached per grid: cos-latitude weights (area_weights),
+or the exact spherical areas r_e^2 dlon (sin lat_n - sin lat_s) of
+cells with edges half way between the centres (cell_areas, for area
+integrals). A mean is one masked matrix product: the field, with the
+weighted axes moved last and flattened, is multiplied by the weights,
+and the valid (finite) points by the same weights for the
+normalization, so missing values (nan) are left out of each mean
+without building index lists.
+"""
+
+from functools import lru_cache
+import numpy as np
+from vert_int import r_e
+
+
+@lru_cache(maxsize=32)
+def _areas(lat,nlon,dlat,dlon,r_e):
+    coslat = np.cos(np.array(lat)*np.pi/180.)
+    area = r_e*r_e*coslat*(dlat*np.pi/180.)*(dlon*np.pi/180.)
+    if nlon is not None:
+        area = np.repeat(area[:,None],nlon,axis=1)
+    area.setflags(write=False)
+    return area
+
+
+def area_weights(lat,lon=None,dlat=2.5,dlon=None,r_e=r_e):
+    """ Cell areas (m2) of a regular grid: (lat,) for zonal bands
+    (dlon = 360 deg) or (lat,lon), cached per grid """
+    nlon = None if lon is None else len(lon)
+    if dlon is None:
+        dlon = 360. if lon is None else 360./nlon
+    lat = tuple(float(ll) for ll in np.asarray(lat))
+    return _areas(lat,nlon,float(dlat),float(dlon),float(r_e))
+
+
+@lru_cache(maxsize=16)
+def _cell_areas(lat,lon,r_e):
+    lat = np.array(lat); lon = np.array(lon)
+    # Cell edges half way between the centres, at most at the poles
+    edges = np.clip(np.concatenate([[1.5*lat[0]-0.5*lat[1]],
+                                    (lat[1:]+lat[:-1])/2.,
+                                    [1.5*lat[-1]-0.5*lat[-2]]]),-90.,90.)
+    dsin = np.abs(np.diff(np.sin(edges*np.pi/180.)))
+    dlon = np.abs(np.gradient(lon))*np.pi/180.
+    area = r_e*r_e*dsin[:,None]*dlon[None,:]
+    area.setflags(write=False)
+    return area
+
+
+def cell_areas(lat,lon,r_e=r_e):
+    """ Exact (lat,lon) areas (m2) of the cells of a grid, cached per
+    grid """
+    return _cell_areas(tuple(float(ll) for ll in np.asarray(lat)),
+                       tuple(float(ll) for ll in np.asarray(lon)),float(r_e))
+
+
+def wgt_mean(var,wgt,axis=-1):
+    """ Weighted mean of `var` over the axes `axis` (int or tuple,
+    matching the shape of `wgt`), ignoring nans, e.g.
+    (var,lat,month) with wgt (lat,) and axis=1 -> (var,month), or
+    (time,lat,lon) with wgt (lat,lon) and axis=(1,2) -> (time,) """
+    axes = (axis,) if np.ndim(axis) == 0 else tuple(axis)
+    wgt = np.asarray(wgt,dtype='f8')
+    xx = np.moveaxis(np.asarray(var),axes,tuple(range(-len(axes),0)))
+    xx = xx.reshape(xx.shape[:xx.ndim-len(axes)]+(-1,))
+    valid = np.isfinite(xx)
+    num = np.matmul(np.where(valid,xx,0.),wgt.ravel())
+    den = np.matmul(valid,wgt.ravel())
+    with np.errstate(invalid='ignore',divide='ignore'):
+        return np.where(den > 0,num/np.maximum(den,1E-300),np.nan)